@@ -1,5 +1,9 @@
 from collections import defaultdict
 import numpy as np
+import os
+
+from agent.coverage import CoverageCounters
+from agent.transfer import TransferQValues, build_transfer_index, transfer_qvalues
 
 class Agent:
     '''
@@ -10,9 +14,13 @@ class Agent:
         '''
         Initialize:
             qvalues : q values of all pair of states and actions
+            qtable : optional dense q table used instead of qvalues
+            coverage : optional counters of visits and updates while learning
             learn : indicates if the agent is learning or not
         '''
         self._qvalues = defaultdict(lambda: defaultdict(lambda: 0))
+        self._qtable = None
+        self._coverage = None
         self._learn = True
 
     def _dict_to_defaultdict(self, dictionary):
@@ -27,6 +35,32 @@ class Agent:
         res.update(dictionary)
         return res
         
+    def use_qtable(self, qtable):
+        '''
+        Method to store q values in a dense q table instead of the nested defaultdict
+        Input:
+            qtable: DenseQTable : q table of a bounded config, None to go back to
+                the nested defaultdict
+        '''
+        self._qtable = qtable
+
+    def enable_coverage(self, section, max_chocolate):
+        '''
+        Method to start counting state visits, updates and td errors while learning
+        Input:
+            section: Integer : number of boxes
+            max_chocolate: Integer : maximum number of chocolates in a box
+        '''
+        self._coverage = CoverageCounters(section, max_chocolate)
+
+    def coverage_report(self, top_k=10):
+        '''
+        Method to summarize the coverage counters, see CoverageCounters.report
+        '''
+        if self._coverage is None:
+            raise ValueError("Coverage is not enabled, call enable_coverage first")
+        return self._coverage.report(top_k)
+
     def learning_mode_on(self):
         '''
         Method to turn on learning mode
@@ -43,6 +77,8 @@ class Agent:
         '''
         Method to get q value given state and action
         '''
+        if self._qtable is not None:
+            return self._qtable.get(state, action)
         state=tuple(list(state))
         action=tuple(list(action))
         return self._qvalues[state][action]
@@ -51,6 +87,9 @@ class Agent:
         '''
         Function to set q value given state and action
         '''
+        if self._qtable is not None:
+            self._qtable.set(state, action, value)
+            return
         state=tuple(list(state))
         action=tuple(list(action))
         self._qvalues[state][action] = value
@@ -61,6 +100,33 @@ class Agent:
         Must be implemented on the child class
         '''
         raise NotImplementedError
+
+    def get_values(self, states):
+        '''
+        Function to get v values from a batch of states.
+        Must be implemented on the child class
+        '''
+        raise NotImplementedError
+
+    def get_actions(self, states):
+        '''
+        Function to get actions from a batch of states.
+        Must be implemented on the child class
+        '''
+        raise NotImplementedError
+
+    def get_best_actions(self, states):
+        '''
+        Method to get the actions with maximum q values for a batch of states
+        Input:
+            states: array : batch of states with shape (B, SECTION)
+        Output:
+            actions: array : best actions with shape (B, 2),
+                [0, 0] for states without legal actions
+        '''
+        states, actions, legal = self._batch_possible_actions(states)
+        q_val = np.where(legal, self._batch_qvalues(states, actions), -np.inf)
+        return self._pick_actions(actions, legal, np.argmax(q_val, axis=1))
         
     def update(self, state, action, reward, next_state):
         
@@ -87,6 +153,82 @@ class Agent:
                 
         return actions
 
+    def _batch_possible_actions(self, states):
+        '''
+        Method to get possible actions for a batch of states as a dense grid.
+        Column k of the grid is the same action for all states, so the legal
+        actions of each state are selected by a mask instead of a list.
+        Input:
+            states: array : batch of states with shape (B, SECTION)
+        Output:
+            states: array : batch of states as an integer array
+            actions: array : action grid with shape (A, 2), ordered like _possible_actions
+            legal: array : boolean mask with shape (B, A), True if the action is legal
+        '''
+        states = np.asarray(states, dtype=np.int64)
+        max_chocolate = max(int(states.max()), 1) if states.size else 1
+
+        boxes = np.repeat(np.arange(1, states.shape[1] + 1), max_chocolate)
+        takes = np.tile(np.arange(1, max_chocolate + 1), states.shape[1])
+        actions = np.stack([boxes, takes], axis=1)
+
+        legal = states[:, boxes - 1] >= takes[None, :]
+
+        return states, actions, legal
+
+    def _batch_qvalues(self, states, actions):
+        '''
+        Method to get q values of a batch of states on an action grid
+        Input:
+            states: array : batch of states with shape (B, SECTION)
+            actions: array : action grid with shape (A, 2) from _batch_possible_actions
+        Output:
+            q_val: array : q values with shape (B, A), 0 for unseen pairs
+        '''
+        if self._qtable is not None:
+            return self._qtable.get_batch(states, actions)
+
+        q_val = np.zeros((len(states), len(actions)))
+        max_chocolate = actions[-1, 1]
+
+        for row, state in enumerate(states.tolist()):
+            # Use get to not insert unseen states into the q table
+            state_qvalues = self._qvalues.get(tuple(state))
+            if not state_qvalues:
+                continue
+
+            # Scatter the stored q values of this state into their grid columns
+            keys = np.array(list(state_qvalues.keys()), dtype=np.int64)
+            cols = (keys[:, 0] - 1) * max_chocolate + (keys[:, 1] - 1)
+            q_val[row, cols] = list(state_qvalues.values())
+
+        return q_val
+
+    def _random_actions(self, legal):
+        '''
+        Method to pick a legal action uniformly at random for each row of a mask
+        Input:
+            legal: array : boolean mask with shape (B, A)
+        Output:
+            idx: array : index of the chosen action of each row
+        '''
+        return np.argmax(np.where(legal, np.random.uniform(size=legal.shape), -1), axis=1)
+
+    def _pick_actions(self, actions, legal, idx):
+        '''
+        Method to gather the chosen actions from the action grid
+        Input:
+            actions: array : action grid with shape (A, 2)
+            legal: array : boolean mask with shape (B, A)
+            idx: array : index of the chosen action of each row
+        Output:
+            chosen: array : chosen actions with shape (B, 2),
+                [0, 0] for states without legal actions
+        '''
+        chosen = actions[idx]
+        chosen[~legal.any(axis=1)] = 0
+        return chosen
+
     def save_model(self, filename):
         '''
         Method to save the learned q value to a file
@@ -95,23 +237,50 @@ class Agent:
         '''
 
         # Convert defaultdict of _qvalues to dictionary
-        dictionary_q = {
-            key: {k: v for k, v in val.items()} for key, val in self._qvalues.items()
-        }
+        if self._qtable is not None:
+            dictionary_q = self._qtable.to_dict()
+        else:
+            dictionary_q = {
+                key: {k: v for k, v in val.items()} for key, val in self._qvalues.items()
+            }
 
         # Save the dictionary
         np.save(filename, dictionary_q)
 
-    def load_model(self, filename):
+        # Save the coverage counters next to the model
+        if self._coverage is not None:
+            self._coverage.save(self._coverage_filename(filename))
+
+    def _coverage_filename(self, filename):
+        '''
+        Helper method to get the coverage filename of a model, model.npy -> model_coverage.npz
+        '''
+        return os.path.splitext(filename)[0] + "_coverage.npz"
+
+    def load_model(self, filename, transfer=False):
         '''
         Method to load q value from a file
         Input:
             filename: string : filename for model, ends with .npy
+            transfer: Boolean : warm start from models of other configs,
+                filename can be a list of filenames
         '''
+        if transfer:
+            self._load_transfer([filename] if isinstance(filename, str) else filename)
+            return
 
         # Load the dictionary
         dict_q = np.load(filename, allow_pickle=True).item()
 
+        # Load the coverage counters saved next to the model
+        if os.path.exists(self._coverage_filename(filename)):
+            self._coverage = CoverageCounters.load(self._coverage_filename(filename))
+
+        # Fill the dense q table if the agent uses one
+        if self._qtable is not None:
+            self._qtable.load_dict(dict_q)
+            return
+
         # Change the dictionary type of actions to defaultdict
         dict_q = {key: self._dict_to_defaultdict(val) for key, val in dict_q.items()}
 
@@ -121,6 +290,31 @@ class Agent:
         # Update q values using dict_q
         self._qvalues.update(dict_q)        
 
+    def _load_transfer(self, filenames):
+        '''
+        Method to seed the q values from models of other configs. A state gets
+        the q values of the source state with the same position after dropping
+        empty boxes and sorting, e.g. (0, 7, 3) gets the q values of (3, 7) and (7, 0, 3),
+        averaged when several source states share a position.
+        Input:
+            filenames: list : filenames of the source models
+        '''
+        index = build_transfer_index(
+            [np.load(filename, allow_pickle=True).item() for filename in filenames]
+        )
+
+        # Dense q tables are filled at once, the nested dictionary when states are used
+        if self._qtable is not None:
+            space = self._qtable.space
+            values = np.zeros((space.n_states, space.n_actions), dtype=np.float64)
+            for idx, state in enumerate(space.states.tolist()):
+                for action, value in transfer_qvalues(index, state).items():
+                    values[idx, space.action_index_of(action)] = value
+            self._qtable.set_all(values)
+            return
+
+        self._qvalues = TransferQValues(index)
+
 class RandomAgent(Agent):
     
     '''
@@ -163,6 +357,31 @@ class RandomAgent(Agent):
         idx_choice = np.random.choice(range(len(actions)))
         
         return actions[idx_choice]
+
+    def get_values(self, states):
+        '''
+        Method to get values on a batch of states
+        Input:
+            states: array : batch of states with shape (B, SECTION)
+        Output:
+            values: array : expected q value of a random action for each state
+        '''
+        states, actions, legal = self._batch_possible_actions(states)
+        q_val = np.where(legal, self._batch_qvalues(states, actions), 0)
+        n_actions = legal.sum(axis=1)
+        return np.sum(q_val, axis=1) / np.maximum(n_actions, 1)
+
+    def get_actions(self, states):
+        '''
+        Method to get random actions for a batch of states
+        Input:
+            states: array : batch of states with shape (B, SECTION)
+        Output:
+            actions: array : actions with shape (B, 2),
+                [0, 0] for states without legal actions
+        '''
+        states, actions, legal = self._batch_possible_actions(states)
+        return self._pick_actions(actions, legal, self._random_actions(legal))
     
     def update(self, state, action, reward, next_state):
         pass
\ No newline at end of file
@@ -0,0 +1,142 @@
+import numpy as np
+
+from agent.state_space import StateSpace
+
+
+class CoverageCounters:
+    '''
+    Counters of how an agent covers the state space while learning, kept in
+    integer arrays indexed like StateSpace:
+        state_visits : number of actions taken on each state
+        action_visits : number of times each (state, action) pair was taken
+        update_counts : number of q value updates of each (state, action) pair
+        td_error_sum : summed absolute td error of the updates of each state
+        last_update : update step of the last update of each state, -1 if never updated
+    '''
+
+    def __init__(self, section, max_chocolate, converged_tol=1e-3):
+        '''
+        Input:
+            section: Integer : number of boxes
+            max_chocolate: Integer : maximum number of chocolates in a box
+            converged_tol: Float : updates with a smaller absolute td error are
+                counted as wasted, their q value was already learned
+        '''
+        self.space = StateSpace(section, max_chocolate)
+        self.converged_tol = converged_tol
+
+        n_states, n_actions = self.space.n_states, self.space.n_actions
+        self.state_visits = np.zeros(n_states, dtype=np.int32)
+        self.action_visits = np.zeros((n_states, n_actions), dtype=np.int32)
+        self.update_counts = np.zeros((n_states, n_actions), dtype=np.int32)
+        self.td_error_sum = np.zeros(n_states, dtype=np.float64)
+        self.last_update = np.full(n_states, -1, dtype=np.int64)
+
+        self.n_updates = 0
+        self.n_converged_updates = 0
+
+    def visit(self, state, action):
+        '''
+        Method to record an action taken on a state
+        '''
+        idx, action_idx = self.space.index_of(state), self.space.action_index_of(action)
+        self.state_visits[idx] += 1
+        self.action_visits[idx, action_idx] += 1
+
+    def update(self, state, action, td_error):
+        '''
+        Method to record a q value update and its td error
+        '''
+        idx, action_idx = self.space.index_of(state), self.space.action_index_of(action)
+        self.update_counts[idx, action_idx] += 1
+        self.td_error_sum[idx] += abs(td_error)
+        self.last_update[idx] = self.n_updates
+
+        self.n_updates += 1
+        if abs(td_error) < self.converged_tol:
+            self.n_converged_updates += 1
+
+    def report(self, top_k=10):
+        '''
+        Method to summarize the coverage of the non terminal states
+        Input:
+            top_k: Integer : number of states in the stale and high error lists
+        Output:
+            report: dictionary with
+                visited_fraction : fraction of states with at least one action taken
+                updated_fraction : fraction of states with at least one update
+                wasted_update_fraction : fraction of updates with a td error below converged_tol
+                updates_histogram : (bin edges, counts) of the number of updates per state,
+                    bins are [0, 1), [1, 2), [2, 4), [4, 8), ...
+                stale_states : visited states whose last update is the oldest,
+                    as (state, update step, visits)
+                high_error_states : updated states with the highest mean absolute td error,
+                    as (state, mean td error, updates)
+        '''
+        states = self.space.states
+
+        # The terminal state is not part of the report
+        visits = self.state_visits[1:]
+        updates = self.update_counts[1:].sum(axis=1)
+        last_update = self.last_update[1:]
+        mean_error = self.td_error_sum[1:] / np.maximum(updates, 1)
+
+        edges = [0, 1]
+        while edges[-1] <= updates.max():
+            edges.append(edges[-1] * 2)
+        counts, _ = np.histogram(updates, bins=edges)
+
+        visited = np.flatnonzero(visits > 0)
+        stale = visited[np.argsort(last_update[visited], kind='stable')[:top_k]]
+
+        updated = np.flatnonzero(updates > 0)
+        high_error = updated[np.argsort(-mean_error[updated], kind='stable')[:top_k]]
+
+        return {
+            'visited_fraction': float(np.mean(visits > 0)),
+            'updated_fraction': float(np.mean(updates > 0)),
+            'wasted_update_fraction': self.n_converged_updates / max(self.n_updates, 1),
+            'updates_histogram': (edges, counts.tolist()),
+            'stale_states': [
+                (states[i + 1].tolist(), int(last_update[i]), int(visits[i])) for i in stale
+            ],
+            'high_error_states': [
+                (states[i + 1].tolist(), float(mean_error[i]), int(updates[i])) for i in high_error
+            ],
+        }
+
+    def save(self, filename):
+        '''
+        Method to save the counters to a file
+        Input:
+            filename: string : filename for counters, ends with .npz
+        '''
+        np.savez_compressed(
+            filename,
+            config=np.array([self.space.section, self.space.max_chocolate]),
+            converged_tol=self.converged_tol,
+            state_visits=self.state_visits,
+            action_visits=self.action_visits,
+            update_counts=self.update_counts,
+            td_error_sum=self.td_error_sum,
+            last_update=self.last_update,
+            totals=np.array([self.n_updates, self.n_converged_updates]),
+        )
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Method to load counters from a file saved with save
+        '''
+        data = np.load(filename)
+        section, max_chocolate = data['config'].tolist()
+
+        counters = cls(section, max_chocolate, float(data['converged_tol']))
+        counters.state_visits = data['state_visits']
+        counters.action_visits = data['action_visits']
+        counters.update_counts = data['update_counts']
+        counters.td_error_sum = data['td_error_sum']
+        counters.last_update = data['last_update']
+        counters.n_updates, counters.n_converged_updates = data['totals'].tolist()
+
+        return counters
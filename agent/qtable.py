@@ -0,0 +1,359 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+from agent.state_space import StateSpace
+
+
+class DenseQTable:
+    '''
+    Q values of every state and action of a bounded config in one contiguous array.
+    Can be used by an agent instead of the nested defaultdict with agent.use_qtable
+    '''
+
+    def __init__(self, section, max_chocolate, values=None):
+        '''
+        Input:
+            section: Integer : number of boxes
+            max_chocolate: Integer : maximum number of chocolates in a box
+            values: array : optional (n_states, n_actions) array to hold the q values
+        '''
+        self.space = StateSpace(section, max_chocolate)
+        if values is None:
+            values = np.zeros((self.space.n_states, self.space.n_actions), dtype=np.float64)
+        self.values = values
+
+    def _decode(self, values):
+        '''
+        Convert stored values to q values, overridden by reduced precision tables
+        '''
+        return values
+
+    def _encode(self, values):
+        '''
+        Convert q values to stored values, overridden by reduced precision tables
+        '''
+        return values
+
+    def get(self, state, action):
+        '''
+        Get q value given state and action
+        '''
+        return float(self._decode(self.values[self.space.index_of(state), self.space.action_index_of(action)]))
+
+    def set(self, state, action, value):
+        '''
+        Set q value given state and action
+        '''
+        self.values[self.space.index_of(state), self.space.action_index_of(action)] = self._encode(value)
+
+    def get_all(self):
+        '''
+        Get the q values of all states and actions as a float array
+        '''
+        return self._decode(self.values)
+
+    def set_all(self, values):
+        '''
+        Set the q values of all states and actions from an (n_states, n_actions) array
+        '''
+        self.values[...] = self._encode(np.asarray(values))
+
+    def get_batch(self, states, actions):
+        '''
+        Get q values of a batch of states on an action grid
+        Input:
+            states: array : batch of states with shape (B, SECTION)
+            actions: array : action grid with shape (A, 2)
+        Output:
+            q_val: array : q values with shape (B, A)
+        '''
+        state_idx = self.space.state_index(states)
+        action_idx = self.space.action_index(actions)
+        return self._decode(self.values[state_idx[:, None], action_idx[None, :]])
+
+    def to_dict(self):
+        '''
+        Convert the table to the nested dictionary format of Agent.save_model.
+        Only states with at least one non zero q value are kept
+        '''
+        dictionary = {}
+        states = self.space.states.tolist()
+        actions = [tuple(action) for action in self.space.actions.tolist()]
+
+        for idx in np.flatnonzero(np.any(self.values != 0, axis=1)):
+            action_idx = np.flatnonzero(self.values[idx] != 0)
+            qvalues = self._decode(self.values[idx, action_idx]).tolist()
+            dictionary[tuple(states[idx])] = dict(zip([actions[i] for i in action_idx], qvalues))
+
+        return dictionary
+
+    def load_dict(self, dictionary):
+        '''
+        Fill the table from the nested dictionary format of Agent.load_model.
+        States outside of the bounded config are ignored. The values are written
+        at once with set_all, a load is not a learning update
+        '''
+        values = np.zeros((self.space.n_states, self.space.n_actions), dtype=np.float64)
+        for state, actions in dictionary.items():
+            if not self.space.contains(state):
+                continue
+            idx = self.space.index_of(state)
+            for action, value in actions.items():
+                values[idx, self.space.action_index_of(action)] = value
+        self.set_all(values)
+
+
+class SharedQTable(DenseQTable):
+    '''
+    Dense q table backed by multiprocessing.shared_memory, so that several
+    processes can read and write the same q values without copying.
+
+    Writes are not locked (Hogwild style), concurrent updates of the same
+    entry may overwrite each other, which is rare since the table is large.
+    '''
+
+    def __init__(self, section, max_chocolate, shm, owner):
+        '''
+        Use SharedQTable.create or SharedQTable.attach instead
+        '''
+        space = StateSpace(section, max_chocolate)
+        values = np.ndarray((space.n_states, space.n_actions), dtype=np.float64, buffer=shm.buf)
+        super().__init__(section, max_chocolate, values)
+        self.shm = shm
+        self.owner = owner
+
+    @property
+    def name(self):
+        '''
+        Name of the shared memory block, used by other processes to attach
+        '''
+        return self.shm.name
+
+    @classmethod
+    def create(cls, section, max_chocolate):
+        '''
+        Allocate a new zero initialized shared q table
+        '''
+        space = StateSpace(section, max_chocolate)
+        size = space.n_states * space.n_actions * np.dtype(np.float64).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        table = cls(section, max_chocolate, shm, owner=True)
+        table.values[...] = 0
+        return table
+
+    @classmethod
+    def attach(cls, name, section, max_chocolate):
+        '''
+        Attach to a shared q table created by another process
+        '''
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(section, max_chocolate, shm, owner=False)
+
+    def close(self):
+        '''
+        Detach from the shared memory. The creator also frees the memory
+        '''
+        self.values = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __deepcopy__(self, memo):
+        '''
+        A deep copy is a private snapshot of the current q values
+        '''
+        return DenseQTable(self.space.section, self.space.max_chocolate, self.values.copy())
+
+
+class QuantizedQTable(DenseQTable):
+    '''
+    Dense q table stored in reduced precision to save memory.
+
+    Q values are bounded in [-1, 1] (rewards are -1, 0, 1 and discount <= 1), so they
+    are stored as float16, or as int8/int16 scaled by 127/32767. Values are read
+    as np.float32, single and batched, so updates and expectations of the agents
+    are computed in float32.
+
+    Small updates of integer tables would be rounded away, so writes use
+    stochastic rounding: the expected stored value equals the written value.
+    '''
+
+    SCALES = {'float16': None, 'int16': 32767, 'int8': 127}
+
+    def __init__(self, section, max_chocolate, dtype='int8', values=None, stochastic_rounding=True):
+        '''
+        Input:
+            section: Integer : number of boxes
+            max_chocolate: Integer : maximum number of chocolates in a box
+            dtype: string : 'float16', 'int16' or 'int8'
+            values: array : optional stored values with this dtype
+            stochastic_rounding: Boolean : round writes of integer tables stochastically
+        '''
+        if dtype not in self.SCALES:
+            raise ValueError("dtype must be 'float16', 'int16' or 'int8'")
+
+        self.dtype = dtype
+        self.scale = self.SCALES[dtype]
+        self.stochastic_rounding = stochastic_rounding
+
+        space = StateSpace(section, max_chocolate)
+        if values is None:
+            values = np.zeros((space.n_states, space.n_actions), dtype=dtype)
+        super().__init__(section, max_chocolate, values)
+
+    def _decode(self, values):
+        if self.scale is None:
+            return np.float32(values) if np.isscalar(values) else values.astype(np.float32)
+        return np.asarray(values, dtype=np.float32) * np.float32(1 / self.scale)
+
+    def _encode(self, values):
+        if self.scale is None:
+            return np.asarray(values, dtype=np.float16)
+        return self._round(np.clip(np.asarray(values, dtype=np.float32), -1, 1) * self.scale)
+
+    def get(self, state, action):
+        '''
+        Get q value given state and action as np.float32
+        '''
+        return np.float32(self._decode(self.values[self.space.index_of(state), self.space.action_index_of(action)]))
+
+    def _round(self, scaled, stochastic=None):
+        '''
+        Round scaled values to the integer dtype
+        '''
+        if stochastic is None:
+            stochastic = self.stochastic_rounding
+        if stochastic:
+            scaled = np.floor(scaled + np.random.uniform(size=np.shape(scaled)))
+        else:
+            scaled = np.rint(scaled)
+        return scaled.astype(self.dtype)
+
+    def set_all(self, values):
+        '''
+        Set all q values with round to nearest, bulk writes are not learning updates
+        '''
+        values = np.clip(np.asarray(values, dtype=np.float32), -1, 1)
+        if self.scale is None:
+            self.values[...] = values.astype(np.float16)
+        else:
+            self.values[...] = self._round(values * self.scale, stochastic=False)
+
+    @classmethod
+    def from_table(cls, table, dtype='int8'):
+        '''
+        Quantize a full precision dense q table
+        '''
+        quantized = cls(table.space.section, table.space.max_chocolate, dtype)
+        quantized.set_all(table.get_all())
+        return quantized
+
+    def save(self, filename):
+        '''
+        Method to save the quantized table to a file
+        Input:
+            filename: string : filename for the table, ends with .npz
+        '''
+        np.savez_compressed(
+            filename,
+            config=np.array([self.space.section, self.space.max_chocolate]),
+            dtype=self.dtype,
+            values=self.values,
+        )
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Method to load a quantized table saved with save, use it with agent.use_qtable
+        '''
+        data = np.load(filename)
+        section, max_chocolate = data['config'].tolist()
+        return cls(section, max_chocolate, str(data['dtype']), data['values'])
+
+
+def _winning_states(space):
+    '''
+    Game theoretic result of every state for the player to move (misere nim):
+    with at most one chocolate in every box the player wins if the number of non
+    empty boxes is even, otherwise if the nim sum of the boxes is not 0.
+    The empty state counts as winning, the previous player took the last chocolate
+    '''
+    states = space.states
+    nim_sum = np.bitwise_xor.reduce(states, axis=1)
+    small = states.max(axis=1) <= 1
+    return np.where(small, np.count_nonzero(states, axis=1) % 2 == 0, nim_sum != 0)
+
+
+def quantization_report(table, quantized):
+    '''
+    Compare a quantized table with the full precision table it was made from.
+    Statistics are computed on the stored states, the non terminal states with
+    at least one non zero legal q value, since the other states are zero in both tables
+    Input:
+        table: DenseQTable : full precision table
+        quantized: QuantizedQTable : quantized table
+    Output:
+        report: dictionary with
+            stored_fraction : fraction of non terminal states that are stored
+            changed_fraction : fraction of stored states whose greedy action changed
+            changed_fraction_all : the same fraction over all non terminal states
+            result_changed_fraction : fraction of stored states where the quantized
+                greedy action has another game theoretic result (win or loss) than
+                the full precision one
+            max_error, mean_error : absolute error of the legal q values of the stored states
+            bytes, quantized_bytes : memory of the values of both tables
+    '''
+    next_idx, legal = table.space.transitions()
+    next_idx, legal = next_idx[1:], legal[1:]
+
+    full = table.get_all()[1:]
+    reduced = quantized.get_all()[1:]
+    stored = np.any(legal & (full != 0), axis=1)
+
+    greedy = np.argmax(np.where(legal, full, -np.inf), axis=1)
+    quantized_greedy = np.argmax(np.where(legal, reduced, -np.inf), axis=1)
+    changed = greedy != quantized_greedy
+
+    # An action wins if the opponent is left in a losing state
+    rows = np.arange(len(full))
+    losing = ~_winning_states(table.space)
+    result_changed = losing[next_idx[rows, greedy]] != losing[next_idx[rows, quantized_greedy]]
+
+    error = np.abs(full - reduced)[legal & stored[:, None]]
+    n_stored = int(stored.sum())
+
+    return {
+        'stored_fraction': float(np.mean(stored)),
+        'changed_fraction': float(changed[stored].mean()) if n_stored else 0.0,
+        'changed_fraction_all': float(np.mean(changed)),
+        'result_changed_fraction': float(result_changed[stored].mean()) if n_stored else 0.0,
+        'max_error': float(error.max()) if n_stored else 0.0,
+        'mean_error': float(error.mean()) if n_stored else 0.0,
+        'bytes': table.values.nbytes,
+        'quantized_bytes': quantized.values.nbytes,
+    }
+
+
+def export_quantized(agent, filename, SECTION, MAX_CHOCOLATE, dtype='int8'):
+    '''
+    Export the q values of an agent as a quantized table, and report how
+    much the quantization changes its greedy policy
+    Input:
+        agent: RL Agent : agent to export
+        filename: string : filename for the table, ends with .npz
+        SECTION: Integer : number of boxes
+        MAX_CHOCOLATE: Integer : maximum number of chocolates in a box
+        dtype: string : 'float16', 'int16' or 'int8'
+    Output:
+        report: dictionary : see quantization_report
+    '''
+    if agent._qtable is not None:
+        table = agent._qtable
+    else:
+        table = DenseQTable(SECTION, MAX_CHOCOLATE)
+        table.load_dict(agent._qvalues)
+
+    quantized = QuantizedQTable.from_table(table, dtype)
+    quantized.save(filename)
+
+    return quantization_report(table, quantized)
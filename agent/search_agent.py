@@ -0,0 +1,296 @@
+from agent.base_agent import Agent
+from agent.transfer import build_transfer_index, canonical_state
+from bisect import insort
+from collections import OrderedDict
+import numpy as np
+import time
+
+
+# Flags of a transposition table entry
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class _SearchTimeout(Exception):
+    '''
+    Raised inside the search when the time budget of the move is spent
+    '''
+
+
+class AlphaBetaAgent(Agent):
+    '''
+    Game tree search agent: iterative deepening negamax with alpha-beta pruning.
+
+    Positions are searched as permutation-sorted box tuples, since the order of
+    the boxes does not change the game. Searched positions are kept in a bounded
+    transposition table that evicts the least recently used position.
+    '''
+
+    def __init__(self, time_budget=1.0, max_depth=None, table_size=1000000, guide=None):
+        '''
+        Initialize search agent
+        Input:
+            time_budget: Float : wall clock seconds to spend on each move
+            max_depth: Integer : optional maximum search depth
+            table_size: Integer : maximum number of positions in the transposition table
+            guide: QLearningAgent : optional trained agent, its values order the
+                moves and evaluate positions at the search horizon. The values are
+                indexed by position when the search agent is created
+        '''
+        super().__init__()
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.table_size = table_size
+        self.guide = guide
+        self._guide_values = None if guide is None else self._index_guide(guide)
+
+        self._table = OrderedDict()
+        self._nodes = 0
+        self._deadline = None
+
+        # Statistics of the last move, see get_action
+        self.last_search = {}
+
+    #######################
+    ## Agent interface ##
+    #######################
+    def get_action(self, state):
+        '''
+        Method to get action given a current state, searching until the time
+        budget is spent or the position is solved
+
+        Input:
+            state: array : current state
+        Output:
+            action: array : action taken, None if there are no legal actions
+
+        After each call last_search holds depth, nodes, seconds, nodes_per_sec,
+        value (from the mover's point of view) and solved
+        '''
+        state = [int(count) for count in state]
+        if sum(state) == 0:
+            return None
+
+        count, take = self._search(tuple(sorted(state)))
+
+        # Map the move on the sorted position back to a box of the real state
+        return [state.index(count) + 1, take]
+
+    def get_value(self, state):
+        '''
+        Method to get the searched value of a state for the player to move
+        '''
+        state = tuple(sorted(int(count) for count in state))
+        if sum(state) == 0:
+            return 0
+
+        self._search(state)
+        return self.last_search['value']
+
+    def update(self, state, action, reward, next_state):
+        pass
+
+    ############
+    ## Search ##
+    ############
+    def _search(self, root):
+        '''
+        Iterative deepening from the sorted root position until the time
+        budget is spent, returns the best move (count, take) of the last
+        completed depth
+        '''
+        start = time.perf_counter()
+        self._deadline = start + self.time_budget
+        self._nodes = 0
+
+        # The game can't last longer than the number of chocolates
+        max_depth = sum(root)
+        if self.max_depth is not None:
+            max_depth = min(max_depth, self.max_depth)
+
+        best_move, value, depth = self._moves(root)[0], 0, 0
+        for d in range(1, max_depth + 1):
+            try:
+                value, move = self._root(root, d)
+            except _SearchTimeout:
+                break
+            best_move, depth = move, d
+
+            # Proven win or loss, deeper search can't change it
+            if abs(value) == 1:
+                break
+
+        seconds = time.perf_counter() - start
+        self.last_search = {
+            'depth': depth,
+            'nodes': self._nodes,
+            'seconds': seconds,
+            'nodes_per_sec': self._nodes / seconds if seconds > 0 else 0,
+            'value': value,
+            'solved': abs(value) == 1 or depth == sum(root),
+        }
+        return best_move
+
+    def _root(self, state, depth):
+        '''
+        Search the root with a full window, returns its value and best move
+        '''
+        alpha, best_move = -np.inf, None
+        for move in self._ordered_moves(state, depth):
+            value = -self._negamax(self._play(state, move), depth - 1, -np.inf, -alpha)
+            if value > alpha:
+                alpha, best_move = value, move
+
+        self._store(state, depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _negamax(self, state, depth, alpha, beta):
+        '''
+        Value of a sorted position for the player to move, +1 win, -1 loss
+        '''
+        self._nodes += 1
+        if self._nodes % 1024 == 0 and time.perf_counter() > self._deadline:
+            raise _SearchTimeout
+
+        # The opponent took the last chocolate
+        total = sum(state)
+        if total == 0:
+            return 1
+        # Only the last chocolate is left
+        if total == 1:
+            return -1
+
+        alpha_orig = alpha
+        entry = self._lookup(state)
+        if entry is not None:
+            entry_depth, value, flag, _ = entry
+            if entry_depth >= depth or abs(value) == 1:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                elif flag == UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        if depth == 0:
+            value = self._evaluate(state)
+            # Keep the guide's evaluations, they cost more than a table lookup
+            if self.guide is not None:
+                self._store(state, 0, value, EXACT, None)
+            return value
+
+        best_value, best_move = -np.inf, None
+        for move in self._ordered_moves(state, depth):
+            value = -self._negamax(self._play(state, move), depth - 1, -beta, -alpha)
+            if value > best_value:
+                best_value, best_move = value, move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= alpha_orig:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self._store(state, depth, best_value, flag, best_move)
+
+        return best_value
+
+    def _evaluate(self, state):
+        '''
+        Value of a position at the search horizon. Scaled below 1 so that
+        only terminal positions give proven values
+        '''
+        if self.guide is None:
+            return 0
+        return 0.5 * float(np.clip(self._guide_value(state), -1, 1))
+
+    def _index_guide(self, guide):
+        '''
+        Values of the guide by canonical position. The guide stores its q values
+        under the box order it saw while playing, so the states of a position are
+        merged with build_transfer_index. The value of a position is its best
+        q value, moves the guide never tried count as 0 like in the guide
+        '''
+        qvalues = guide._qtable.to_dict() if guide._qtable is not None else guide._qvalues
+
+        values = {}
+        for position, row in build_transfer_index([qvalues]).items():
+            value = max(row.values())
+            if len(row) < sum(set(position)):
+                value = max(value, 0)
+            values[position] = value
+        return values
+
+    def _guide_value(self, state):
+        '''
+        Value of a position for the player to move according to the guide, 0 if unknown
+        '''
+        return self._guide_values.get(canonical_state(state), 0)
+
+    ###########
+    ## Moves ##
+    ###########
+    def _moves(self, state):
+        '''
+        Moves (count, take) of a sorted position. Boxes with the same count give
+        the same positions, so each count is only used once
+        '''
+        return [
+            (count, take)
+            for count in sorted(set(state), reverse=True) if count > 0
+            for take in range(1, count + 1)
+        ]
+
+    def _play(self, state, move):
+        '''
+        Sorted position after a move (count, take)
+        '''
+        count, take = move
+        boxes = list(state)
+        boxes.remove(count)
+        insort(boxes, count - take)
+        return tuple(boxes)
+
+    def _ordered_moves(self, state, depth):
+        '''
+        Moves ordered by the best move of the transposition table first, then by
+        the guide's values of the next positions (lowest value for the opponent first)
+        '''
+        moves = self._moves(state)
+
+        if self.guide is not None and depth > 1:
+            values = [self._guide_value(self._play(state, move)) for move in moves]
+            order = np.argsort(values, kind='stable')
+            moves = [moves[i] for i in order]
+
+        entry = self._table.get(state)
+        if entry is not None and entry[3] is not None:
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
+
+        return moves
+
+    #########################
+    ## Transposition table ##
+    #########################
+    def _lookup(self, state):
+        '''
+        Get the entry (depth, value, flag, best_move) of a position, None if unknown
+        '''
+        entry = self._table.get(state)
+        if entry is not None:
+            self._table.move_to_end(state)
+        return entry
+
+    def _store(self, state, depth, value, flag, best_move):
+        '''
+        Store the entry of a position, evicting the least recently used position if full
+        '''
+        self._table[state] = (depth, value, flag, best_move)
+        self._table.move_to_end(state)
+        if len(self._table) > self.table_size:
+            self._table.popitem(last=False)
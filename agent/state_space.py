@@ -0,0 +1,132 @@
+import numpy as np
+
+
+class StateSpace:
+    '''
+    Dense indexing of the bounded greedy chocolate state and action space.
+
+    A state is the number of chocolates in each of the SECTION boxes, each
+    between 0 and MAX_CHOCOLATE. States are indexed in mixed radix with base
+    MAX_CHOCOLATE + 1, so the empty (terminal) state always has index 0.
+
+    An action [box, n] (box is 1-based, like _possible_actions) is indexed as
+    (box - 1) * MAX_CHOCOLATE + (n - 1).
+    '''
+
+    def __init__(self, section, max_chocolate):
+        '''
+        Input:
+            section: Integer : number of boxes
+            max_chocolate: Integer : maximum number of chocolates in a box
+        '''
+        self.section = section
+        self.max_chocolate = max_chocolate
+        self.base = max_chocolate + 1
+
+        self.n_states = self.base ** section
+        self.n_actions = section * max_chocolate
+
+        # Stride of each box in the state index, the first box is the most significant
+        self.strides = self.base ** np.arange(section - 1, -1, -1, dtype=np.int64)
+
+        self._states = None
+        self._actions = None
+
+    @property
+    def states(self):
+        '''
+        Array (n_states, section) of every state, row i is the state with index i
+        '''
+        if self._states is None:
+            idx = np.arange(self.n_states, dtype=np.int64)
+            self._states = (idx[:, None] // self.strides[None, :]) % self.base
+        return self._states
+
+    @property
+    def actions(self):
+        '''
+        Array (n_actions, 2) of every action, row i is the action with index i
+        '''
+        if self._actions is None:
+            boxes = np.repeat(np.arange(1, self.section + 1), self.max_chocolate)
+            takes = np.tile(np.arange(1, self.max_chocolate + 1), self.section)
+            self._actions = np.stack([boxes, takes], axis=1).astype(np.int64)
+        return self._actions
+
+    def state_index(self, states):
+        '''
+        Index of one state (section,) or a batch of states (B, section)
+        '''
+        states = np.asarray(states, dtype=np.int64)
+        if states.shape[-1] != self.section or np.any((states < 0) | (states > self.max_chocolate)):
+            raise ValueError(
+                f"States must have {self.section} boxes of 0 to {self.max_chocolate} chocolates"
+            )
+        return states @ self.strides
+
+    def action_index(self, actions):
+        '''
+        Index of one action [box, n] or a batch of actions (B, 2)
+        '''
+        actions = np.asarray(actions, dtype=np.int64)
+        boxes, takes = actions[..., 0], actions[..., 1]
+        if np.any((boxes < 1) | (boxes > self.section) | (takes < 1) | (takes > self.max_chocolate)):
+            raise ValueError(
+                f"Actions must take 1 to {self.max_chocolate} chocolates from box 1 to {self.section}"
+            )
+        return (boxes - 1) * self.max_chocolate + (takes - 1)
+
+    def index_of(self, state):
+        '''
+        Index of a single state, faster than state_index for short tuples
+        '''
+        if len(state) != self.section:
+            raise ValueError(f"States must have {self.section} boxes")
+
+        idx = 0
+        for count in state:
+            count = int(count)
+            if count < 0 or count > self.max_chocolate:
+                raise ValueError(f"Boxes must have 0 to {self.max_chocolate} chocolates, got {count}")
+            idx = idx * self.base + count
+        return idx
+
+    def action_index_of(self, action):
+        '''
+        Index of a single action [box, n], faster than action_index
+        '''
+        box, take = int(action[0]), int(action[1])
+        if box < 1 or box > self.section or take < 1 or take > self.max_chocolate:
+            raise ValueError(
+                f"Actions must take 1 to {self.max_chocolate} chocolates from box 1 to {self.section}"
+            )
+        return (box - 1) * self.max_chocolate + take - 1
+
+    def contains(self, state):
+        '''
+        Check if a state fits in this state space
+        '''
+        return len(state) == self.section and max(state) <= self.max_chocolate
+
+    def transitions(self):
+        '''
+        Precompute the transition function of the game for every state and action
+
+        Output:
+            next_idx: array (n_states, n_actions) : index of the next state,
+                illegal actions point to the state itself
+            legal: array (n_states, n_actions) : True if the action is legal
+        '''
+        states = self.states
+        actions = self.actions
+
+        # Number of chocolates in the chosen box, for every state and action
+        box_count = states[:, actions[:, 0] - 1]
+        legal = box_count >= actions[None, :, 1]
+
+        # Taking n chocolates from a box lowers the index by n * stride of that box
+        step = actions[:, 1] * self.strides[actions[:, 0] - 1]
+        idx = np.arange(self.n_states, dtype=np.int64)
+        next_idx = np.where(legal, idx[:, None] - step[None, :], idx[:, None])
+
+        return next_idx, legal
@@ -66,6 +66,22 @@ class QLearningAgent(Agent):
         
         q_val = [self.get_qvalue(state, action) for action in actions]
         return actions[np.argmax(q_val)]
+
+    def get_values(self, states):
+        '''
+        Function to get value functions of a batch of states
+        V(s) = max(Q(s, a))
+
+        Input:
+            states: array : batch of states with shape (B, SECTION)
+        Output:
+            values: array : value of each state
+        '''
+        states, actions, legal = self._batch_possible_actions(states)
+        q_val = np.where(legal, self._batch_qvalues(states, actions), -np.inf)
+        values = np.max(q_val, axis=1)
+        values[~legal.any(axis=1)] = 0
+        return values
         
     def get_action(self, state):
         
@@ -97,8 +113,34 @@ class QLearningAgent(Agent):
         else:
             # If not learning, just get the best action
             chosen_action = self.get_best_action(state)
+
+        if self._learn and self._coverage is not None:
+            self._coverage.visit(state, chosen_action)
         
         return chosen_action
+
+    def get_actions(self, states):
+
+        '''
+        Method to get actions given a batch of states, with exploration
+        applied independently on each state
+
+        Input:
+            states: array : batch of states with shape (B, SECTION)
+        Output:
+            actions: array : actions with shape (B, 2),
+                [0, 0] for states without legal actions
+        '''
+        states, actions, legal = self._batch_possible_actions(states)
+        q_val = np.where(legal, self._batch_qvalues(states, actions), -np.inf)
+        idx = np.argmax(q_val, axis=1)
+
+        if self._learn:
+            # Pick a random action for exploration on each state with probability epsilon
+            explore = np.random.uniform(size=len(states)) < self.epsilon
+            idx = np.where(explore, self._random_actions(legal), idx)
+
+        return self._pick_actions(actions, legal, idx)
     
     def update(self, state, action, reward, next_state):
         
@@ -111,15 +153,26 @@ class QLearningAgent(Agent):
             action: array : action taken
             reward: Float : reward of taking action given current state
             next_state: array : next state after taking an action
+        Output:
+            td_error: Float : r + gamma * V(s') - Q(s,a) before the update,
+                None if the agent is not learning
         '''
         # update active only if the agent is learning
         if self._learn:
 
-            new_value = (1 - self.alpha) * self.get_qvalue(state, action)
-            new_value += (self.alpha * (reward + (self.discount * self.get_value(next_state))))
+            q_value = self.get_qvalue(state, action)
+            target = reward + (self.discount * self.get_value(next_state))
+
+            new_value = (1 - self.alpha) * q_value
+            new_value += (self.alpha * target)
             
             self.set_qvalue(state, action, new_value)
 
+            if self._coverage is not None:
+                self._coverage.update(state, action, target - q_value)
+
+            return target - q_value
+
 
 class ExpectedSarsaAgent(QLearningAgent):
 
@@ -163,4 +216,28 @@ class ExpectedSarsaAgent(QLearningAgent):
         # with probability 1 - epsilon, select the best state
         value += (1 - self.epsilon) * self.get_qvalue(state, self.get_best_action(state))
 
-        return value
\ No newline at end of file
+        return value
+
+    def get_values(self, states):
+        '''
+        Override get_values function from QLearningAgent
+        V(s) = E[Q(s, a)] = sum (p(a|s) * Q(s, a))
+
+        Input:
+            states: array : batch of states with shape (B, SECTION)
+        Output:
+            values: array : value of each state
+        '''
+        states, actions, legal = self._batch_possible_actions(states)
+        q_val = self._batch_qvalues(states, actions)
+        n_actions = legal.sum(axis=1)
+
+        # with probability epsilon, uniformly selecting action
+        values = np.sum(np.where(legal, q_val, 0), axis=1)
+        values *= self.epsilon / np.maximum(n_actions, 1)
+
+        # with probability 1 - epsilon, select the best state
+        values += (1 - self.epsilon) * np.max(np.where(legal, q_val, -np.inf), axis=1)
+
+        values[n_actions == 0] = 0
+        return values
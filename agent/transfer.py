@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+
+def canonical_state(state):
+    '''
+    Position of a state without its empty boxes, sorted. States of different
+    configs with the same canonical state are the same position of the game
+    '''
+    return tuple(sorted(int(count) for count in state if count > 0))
+
+
+def build_transfer_index(dictionaries):
+    '''
+    Index the q values of models of other configs by canonical state.
+    An action (box, n) is keyed by (number of chocolates in the box, n), so all
+    the source states with the same position (permutations of the boxes, empty
+    boxes, other models) are merged by averaging the q value of each key
+    Input:
+        dictionaries: list : q value dictionaries as saved by Agent.save_model
+    Output:
+        index: dictionary : canonical state -> {(count, n): q value}
+    '''
+    sums = defaultdict(lambda: defaultdict(float))
+    counts = defaultdict(lambda: defaultdict(int))
+    for dictionary in dictionaries:
+        for state, qvalues in dictionary.items():
+            canonical = canonical_state(state)
+            for (box, take), value in qvalues.items():
+                key = (int(state[box - 1]), int(take))
+                sums[canonical][key] += value
+                counts[canonical][key] += 1
+
+    return {
+        canonical: {key: value / counts[canonical][key] for key, value in row.items()}
+        for canonical, row in sums.items()
+    }
+
+
+def transfer_qvalues(index, state):
+    '''
+    Q values of a state mapped from the source models with the same position.
+    Taking n chocolates from a box with c chocolates gets the q value of taking
+    n chocolates from a box with c chocolates in the source states
+    Input:
+        index: dictionary : output of build_transfer_index
+        state: tuple : state of the new config
+    Output:
+        qvalues: dictionary : action -> q value, empty if the position is unknown
+    '''
+    source_qvalues = index.get(canonical_state(state))
+    if source_qvalues is None:
+        return {}
+
+    qvalues = {}
+    for box, count in enumerate(state):
+        for take in range(1, int(count) + 1):
+            value = source_qvalues.get((int(count), take))
+            if value is not None:
+                qvalues[(box + 1, take)] = value
+    return qvalues
+
+
+class TransferQValues(dict):
+    '''
+    Q table of an agent warm started from models of other configs.
+    Works like the nested defaultdict of Agent: a missing state is filled
+    from the source models when it is first used
+    '''
+
+    def __init__(self, index):
+        '''
+        Input:
+            index: dictionary : output of build_transfer_index
+        '''
+        super().__init__()
+        self.index = index
+
+    def _transfer(self, state):
+        row = defaultdict(lambda: 0)
+        row.update(transfer_qvalues(self.index, state))
+        return row
+
+    def __missing__(self, state):
+        row = self._transfer(state)
+        self[state] = row
+        return row
+
+    def get(self, state, default=None):
+        if state in self:
+            return self[state]
+        # Only keep the states that have a source position
+        row = self._transfer(state)
+        if not row:
+            return default
+        self[state] = row
+        return row
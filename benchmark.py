@@ -0,0 +1,253 @@
+from environment import Environment
+from agent.td_agent import QLearningAgent
+from agent.td_agent import ExpectedSarsaAgent
+from agent.base_agent import RandomAgent
+from trainer import TwoPlayerGameTrainer, ValueIterationTrainer
+from metrics import MemorySink
+
+import json
+import time
+
+
+# Fractions of optimal moves reported by the benchmark
+THRESHOLDS = (0.9, 0.99, 1.0)
+
+AGENTS = {
+    'QLearningAgent': QLearningAgent,
+    'ExpectedSarsaAgent': ExpectedSarsaAgent,
+}
+
+
+class TimeToOptimalBenchmark:
+    '''
+    Class for measuring how fast agents converge to the optimal policy.
+
+    The greedy policy is scored at every checkpoint against the solved game
+    (ValueIterationTrainer), on every state of the config: every state with
+    boxes up to MAX_CHOCOLATE can be reached by taking chocolates from a start state.
+
+    Consists of:
+        run -> train one agent on one config and record its curve
+        run_grid -> run every agent and training mode on a grid of configs
+        run_transfer -> compare a cold start with a warm start from other configs
+    '''
+
+    @staticmethod
+    def run(agent, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, mode='self_play', checkpoint_games=2000,
+            max_games=100000, solution=None, start_sampler=None):
+        '''
+        Train an agent and score it every checkpoint_games games until it plays
+        optimally or max_games games are played
+
+        Input:
+            agent: RL Agent : agent to train
+            SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE: Integer : config of the game
+            mode: string : 'self_play' or 'random' (play_and_train against RandomAgent)
+            checkpoint_games: Integer : Number of games between two checkpoints
+            max_games: Integer : maximum number of games
+            solution: tuple : optional output of ValueIterationTrainer.solve
+            start_sampler: PrioritizedStartSampler : optional sampler of training start states
+        Output:
+            curve: list : one dictionary per checkpoint with games, updates,
+                seconds (training time only) and optimal_rate
+            agent: RL Agent : the trained agent
+        '''
+        if solution is None:
+            solution = ValueIterationTrainer.solve(SECTION, MAX_CHOCOLATE)
+
+        env = Environment(SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, start_sampler)
+        opponent = RandomAgent()
+        sink = MemorySink(maxlen=None)
+
+        curve = []
+        games, updates, seconds = 0, 0, 0.0
+        while games < max_games:
+            start = time.perf_counter()
+            if mode == 'self_play':
+                agent, _ = TwoPlayerGameTrainer.self_play(
+                    env, agent, n_games=checkpoint_games, iteration=1, plot_output=False,
+                    metrics=sink, verbose=False
+                )
+            else:
+                TwoPlayerGameTrainer.play_and_train(
+                    env, agent, opponent, n_games=checkpoint_games, learn=True, verbose=False,
+                    metrics=sink
+                )
+            seconds += time.perf_counter() - start
+
+            # Every move of agent 1 is one update while learning
+            games += checkpoint_games
+            updates += sum(record['moves'] for record in sink.select('game'))
+            sink.records.clear()
+
+            rate = ValueIterationTrainer.optimal_action_rate(agent, SECTION, MAX_CHOCOLATE, solution)
+            curve.append({
+                'games': games, 'updates': updates, 'seconds': seconds, 'optimal_rate': float(rate)
+            })
+
+            if rate >= THRESHOLDS[-1]:
+                break
+
+        return curve, agent
+
+    @staticmethod
+    def time_to_thresholds(curve):
+        '''
+        Get the first checkpoint reaching each threshold of THRESHOLDS
+        Input:
+            curve: list : output of run
+        Output:
+            reached: dictionary : threshold -> checkpoint, None if never reached
+        '''
+        return {
+            str(threshold): next(
+                (point for point in curve if point['optimal_rate'] >= threshold), None
+            )
+            for threshold in THRESHOLDS
+        }
+
+    @staticmethod
+    def run_grid(configs, agents=('QLearningAgent', 'ExpectedSarsaAgent'), modes=('random', 'self_play'),
+                 alpha=0.1, epsilon=0.3, discount=1, checkpoint_games=2000, max_games=100000,
+                 filename=None, verbose=True):
+        '''
+        Run the benchmark on a grid of configs, agents and training modes
+
+        Input:
+            configs: list : (SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE) configs
+            agents: tuple : names of agents in AGENTS
+            modes: tuple : training modes, see run
+            alpha, epsilon, discount: Float : hyperparameters of the agents
+            checkpoint_games: Integer : Number of games between two checkpoints
+            max_games: Integer : maximum number of games of each run
+            filename: string : optional JSON file to save the results to
+            verbose: Boolean : Indicates whether a summary is printed
+        Output:
+            results: list : one dictionary per run with config, agent, mode,
+                hyperparameters, curve and reached (see time_to_thresholds)
+        '''
+        results = []
+
+        for SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE in configs:
+            solution = ValueIterationTrainer.solve(SECTION, MAX_CHOCOLATE, discount)
+
+            for agent_name in agents:
+                for mode in modes:
+                    agent = AGENTS[agent_name](alpha=alpha, epsilon=epsilon, discount=discount)
+                    curve, _ = TimeToOptimalBenchmark.run(
+                        agent, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, mode, checkpoint_games,
+                        max_games, solution
+                    )
+
+                    result = {
+                        'config': [SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE],
+                        'agent': agent_name,
+                        'mode': mode,
+                        'alpha': alpha,
+                        'epsilon': epsilon,
+                        'discount': discount,
+                        'curve': curve,
+                        'reached': TimeToOptimalBenchmark.time_to_thresholds(curve),
+                    }
+                    results.append(result)
+
+                    if verbose:
+                        TimeToOptimalBenchmark.print_result(result)
+
+        if filename is not None:
+            with open(filename, 'w') as f:
+                json.dump(results, f, indent=1)
+
+        return results
+
+    @staticmethod
+    def run_transfer(source_files, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, agent_name='QLearningAgent',
+                     mode='self_play', alpha=0.1, epsilon=0.3, discount=1, checkpoint_games=2000,
+                     max_games=100000, verbose=True):
+        '''
+        Compare a cold start with a warm start from models of other configs
+        (Agent.load_model with transfer=True)
+
+        Input:
+            source_files: list : filenames of the source models
+            SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE: Integer : config of the game
+            agent_name: string : name of the agent in AGENTS
+            mode: string : training mode, see run
+            alpha, epsilon, discount: Float : hyperparameters of the agents
+            checkpoint_games: Integer : Number of games between two checkpoints
+            max_games: Integer : maximum number of games of each run
+            verbose: Boolean : Indicates whether the comparison is printed
+        Output:
+            result: dictionary with the cold and warm curves, the seconds spent
+                loading the source models, and for each threshold the games and
+                seconds saved by the warm start (None if one of them never reached it)
+        '''
+        solution = ValueIterationTrainer.solve(SECTION, MAX_CHOCOLATE, discount)
+
+        cold = AGENTS[agent_name](alpha=alpha, epsilon=epsilon, discount=discount)
+        cold_curve, _ = TimeToOptimalBenchmark.run(
+            cold, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, mode, checkpoint_games, max_games, solution
+        )
+
+        warm = AGENTS[agent_name](alpha=alpha, epsilon=epsilon, discount=discount)
+        start = time.perf_counter()
+        warm.load_model(source_files, transfer=True)
+        transfer_seconds = time.perf_counter() - start
+        warm_rate = ValueIterationTrainer.optimal_action_rate(warm, SECTION, MAX_CHOCOLATE, solution)
+        warm_curve, _ = TimeToOptimalBenchmark.run(
+            warm, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, mode, checkpoint_games, max_games, solution
+        )
+
+        cold_reached = TimeToOptimalBenchmark.time_to_thresholds(cold_curve)
+        warm_reached = TimeToOptimalBenchmark.time_to_thresholds(warm_curve)
+        saved = {}
+        for threshold in cold_reached:
+            cold_point, warm_point = cold_reached[threshold], warm_reached[threshold]
+            if cold_point is None or warm_point is None:
+                saved[threshold] = None
+            else:
+                saved[threshold] = {
+                    'games': cold_point['games'] - warm_point['games'],
+                    'seconds': cold_point['seconds'] - warm_point['seconds'] - transfer_seconds,
+                }
+
+        if verbose:
+            print(f"\nWarm start from {len(source_files)} models: {warm_rate:.3f} optimal moves "
+                  f"before training, loaded in {transfer_seconds:.2f}s")
+            for threshold, point in saved.items():
+                if point is None:
+                    print(f"  {float(threshold):.0%}: not reached by both runs")
+                else:
+                    print(f"  {float(threshold):.0%}: {point['games']} games and "
+                          f"{point['seconds']:.1f}s saved")
+
+        return {
+            'cold': cold_curve,
+            'warm': warm_curve,
+            'initial_optimal_rate': float(warm_rate),
+            'transfer_seconds': transfer_seconds,
+            'saved': saved,
+        }
+
+    @staticmethod
+    def print_result(result):
+        '''
+        Print the games, updates and seconds needed to reach each threshold
+        '''
+        print(f"\n{result['agent']} ({result['mode']}) on config {tuple(result['config'])}, "
+              f"final optimal rate {result['curve'][-1]['optimal_rate']:.3f}")
+        for threshold, point in result['reached'].items():
+            if point is None:
+                print(f"  {float(threshold):.0%}: not reached")
+            else:
+                print(f"  {float(threshold):.0%}: {point['games']} games, {point['updates']} updates, "
+                      f"{point['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+
+    CONFIGS = [(2, 1, 8), (3, 1, 8), (3, 3, 12)]
+
+    TimeToOptimalBenchmark.run_grid(
+        CONFIGS, checkpoint_games=2000, max_games=40000, filename="benchmark_results.json"
+    )
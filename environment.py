@@ -11,8 +11,15 @@ MIN_CHOCOLATE = 3
 
 class Environment:
 
-    def __init__(self, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE):
+    def __init__(self, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, start_sampler=None):
+        '''
+        Input:
+            SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE: Integer : config of the game
+            start_sampler: PrioritizedStartSampler : optional sampler of start states,
+                used by reset(from_sampler=True)
+        '''
         self.game = GreedyChocolateGame(SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, False)
+        self.start_sampler = start_sampler
         
     @property
     def state(self):
@@ -34,11 +41,16 @@ class Environment:
         
         return actions
 
-    def reset(self):
+    def reset(self, from_sampler=False):
         '''
         Function to restart the state of game
+
+        Input: from_sampler -> draw the start state from start_sampler if there is one,
+            otherwise the start state is uniform
         '''
         self.game.reset()
+        if from_sampler and self.start_sampler is not None:
+            self.game.boxes = self.start_sampler.sample()
         return self.state
 
     def step(self, action):
@@ -225,8 +225,21 @@ if __name__ == "__main__":
                     f"qagent_self_play_{SECTION}_{MIN_CHOCOLATE}_{MAX_CHOCOLATE}.npy"
                 )
                 agent.load_model(filepath)
+            elif sys.argv[2] == "--search":
+                # Create search agent, guided by the best model if it exists
+                from agent.search_agent import AlphaBetaAgent
+                from agent.td_agent import QLearningAgent
+                guide = None
+                filepath = os.path.join(
+                    "model",
+                    f"qagent_self_play_{SECTION}_{MIN_CHOCOLATE}_{MAX_CHOCOLATE}.npy"
+                )
+                if os.path.exists(filepath):
+                    guide = QLearningAgent(0, 0, 1)
+                    guide.load_model(filepath)
+                agent = AlphaBetaAgent(time_budget=1.0, guide=guide)
             else:
-                print("ERROR! vs_agent argument only have --random and --best parameters")
+                print("ERROR! vs_agent argument only have --random, --best and --search parameters")
                 exit(1)
 
             # Create new game
@@ -248,6 +261,10 @@ if __name__ == "__main__":
                 ## Agent turn ##
                 ################
                 agent_action = agent.get_action(list(game.boxes))
+                if VERBOSE and getattr(agent, "last_search", None):
+                    search = agent.last_search
+                    print(f"\nAgent searched depth {search['depth']} in {search['seconds']:.2f}s "
+                          f"({search['nodes_per_sec']:.0f} nodes/sec)")
                 agent_action[0] -= 1
                 done = game.play(agent_action)
                 if done:
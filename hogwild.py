@@ -0,0 +1,188 @@
+from environment import Environment
+from agent.td_agent import QLearningAgent
+from agent.qtable import DenseQTable, SharedQTable
+from trainer import TwoPlayerGameTrainer, ValueIterationTrainer
+
+import multiprocessing as mp
+import numpy as np
+import time
+
+
+class _CountingQLearningAgent(QLearningAgent):
+    '''
+    QLearningAgent that counts its updates, used to measure throughput
+    '''
+
+    def __init__(self, alpha, epsilon, discount):
+        super().__init__(alpha, epsilon, discount)
+        self.n_updates = 0
+
+    def update(self, state, action, reward, next_state):
+        self.n_updates += 1
+        return super().update(state, action, reward, next_state)
+
+
+def _worker(name, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, alpha, epsilon, discount, n_games, seed):
+    '''
+    Self play games in one process, writing td updates straight into the shared q table.
+    The opponent is the greedy policy of the same shared q table.
+
+    Output:
+        n_updates: Integer : number of q value updates made by this worker
+    '''
+    np.random.seed(seed)
+
+    table = SharedQTable.attach(name, SECTION, MAX_CHOCOLATE)
+
+    agent = _CountingQLearningAgent(alpha, epsilon, discount)
+    agent.use_qtable(table)
+
+    opponent = QLearningAgent(0, 0, discount)
+    opponent.use_qtable(table)
+
+    env = Environment(SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE)
+    TwoPlayerGameTrainer.play_and_train(env, agent, opponent, n_games=n_games, learn=True, verbose=False)
+
+    table.close()
+    return agent.n_updates
+
+
+class HogwildTrainer:
+    '''
+    Class for lock free multi process training of one QLearningAgent.
+
+    Consists of:
+        train -> train a QLearningAgent with several processes sharing one q table
+        benchmark -> measure updates/sec for several numbers of workers
+    '''
+
+    @staticmethod
+    def train(agent, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, n_games=10000, n_workers=None):
+        '''
+        Train an agent by self play in n_workers processes. Every process runs its
+        own environment and writes into the same shared q table without locks.
+
+        Input:
+            agent: QLearningAgent : agent to train, its alpha, epsilon and discount are used
+            SECTION: Integer : number of boxes
+            MIN_CHOCOLATE: Integer : minimum number of chocolates in a box at the start
+            MAX_CHOCOLATE: Integer : maximum number of chocolates in a box
+            n_games: Integer : Number of games to play by each worker
+            n_workers: Integer : Number of processes, defaults to the number of CPUs
+        Output:
+            agent: QLearningAgent : the same agent, with the result in its own q table
+                if it has one, otherwise in a new dense q table
+            n_updates: Integer : total number of q value updates
+        '''
+        if n_workers is None:
+            n_workers = mp.cpu_count()
+
+        table = SharedQTable.create(SECTION, MAX_CHOCOLATE)
+
+        # Start from the q values the agent already has
+        if agent._qtable is not None:
+            table.set_all(agent._qtable.get_all())
+        else:
+            table.load_dict(agent._qvalues)
+
+        seeds = np.random.randint(0, 2**31 - 1, size=n_workers)
+        args = [
+            (table.name, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE,
+             agent.alpha, agent.epsilon, agent.discount, n_games, int(seed))
+            for seed in seeds
+        ]
+
+        try:
+            with mp.Pool(n_workers) as pool:
+                n_updates = sum(pool.starmap(_worker, args))
+
+            # Keep a private copy of the result, the shared memory is freed below.
+            # An agent with its own table keeps it, e.g. the dtype of a QuantizedQTable
+            if agent._qtable is not None:
+                agent._qtable.set_all(table.values)
+            else:
+                agent.use_qtable(DenseQTable(SECTION, MAX_CHOCOLATE, table.values.copy()))
+        finally:
+            table.close()
+
+        return agent, n_updates
+
+    @staticmethod
+    def benchmark(SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, n_games=5000, workers=(1, 2, 4),
+                  alpha=0.1, epsilon=0.3, discount=1, verbose=True):
+        '''
+        Measure updates/sec and policy quality for several numbers of workers.
+        Each worker plays n_games, the serial agent plays the same total number of games.
+
+        Input:
+            SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE: Integer : config of the game
+            n_games: Integer : Number of games to play by each worker
+            workers: tuple : numbers of workers to benchmark
+            alpha, epsilon, discount: Float : hyperparameters of the agents
+            verbose: Boolean : Indicates whether the results are printed
+        Output:
+            results: list : one dictionary per run with workers, games, updates,
+                seconds, updates_per_sec and optimal_rate
+        '''
+        solution = ValueIterationTrainer.solve(SECTION, MAX_CHOCOLATE, discount)
+        results = []
+
+        for n_workers in workers:
+            agent = QLearningAgent(alpha, epsilon, discount)
+
+            start = time.perf_counter()
+            agent, n_updates = HogwildTrainer.train(
+                agent, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, n_games=n_games, n_workers=n_workers
+            )
+            seconds = time.perf_counter() - start
+
+            results.append({
+                'workers': n_workers,
+                'games': n_games * n_workers,
+                'updates': n_updates,
+                'seconds': seconds,
+                'updates_per_sec': n_updates / seconds,
+                'optimal_rate': ValueIterationTrainer.optimal_action_rate(
+                    agent, SECTION, MAX_CHOCOLATE, solution
+                ),
+            })
+
+        # Serial agent with the same number of games as the largest run
+        agent = _CountingQLearningAgent(alpha, epsilon, discount)
+        opponent = QLearningAgent(0, 0, discount)
+        opponent._qvalues = agent._qvalues
+        env = Environment(SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE)
+
+        start = time.perf_counter()
+        TwoPlayerGameTrainer.play_and_train(
+            env, agent, opponent, n_games=n_games * max(workers), learn=True, verbose=False
+        )
+        seconds = time.perf_counter() - start
+
+        results.append({
+            'workers': 'serial',
+            'games': n_games * max(workers),
+            'updates': agent.n_updates,
+            'seconds': seconds,
+            'updates_per_sec': agent.n_updates / seconds,
+            'optimal_rate': ValueIterationTrainer.optimal_action_rate(
+                agent, SECTION, MAX_CHOCOLATE, solution
+            ),
+        })
+
+        if verbose:
+            for result in results:
+                print(f"workers={result['workers']}: {result['updates']} updates in "
+                      f"{result['seconds']:.1f}s ({result['updates_per_sec']:.0f} updates/sec), "
+                      f"optimal moves {result['optimal_rate']:.3f}")
+
+        return results
+
+
+if __name__ == "__main__":
+
+    SECTION = 3
+    MAX_CHOCOLATE = 20
+    MIN_CHOCOLATE = 3
+
+    HogwildTrainer.benchmark(SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE)
@@ -0,0 +1,98 @@
+from collections import deque
+import csv
+import json
+
+
+# Keys of the records written by TwoPlayerGameTrainer.play_and_train and self_play
+TRAINING_FIELDS = ['event', 'game', 'result', 'moves', 'iteration', 'win_rate']
+
+
+class MemorySink:
+    '''
+    Metrics sink that keeps the most recent records in memory (ring buffer).
+
+    All sinks have the following methods:
+        sink.write(record) -> store one record, a dictionary of plain values
+        sink.close() -> release the resources of the sink
+    '''
+
+    def __init__(self, maxlen=100000):
+        '''
+        Input:
+            maxlen: Integer : maximum number of records kept, None for unbounded
+        '''
+        self.records = deque(maxlen=maxlen)
+
+    def write(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+    def select(self, event):
+        '''
+        Method to get the stored records of one event type
+        Input:
+            event: string : value of the 'event' key of the records
+        Output:
+            records: list : records of that event, oldest first
+        '''
+        return [record for record in self.records if record.get('event') == event]
+
+
+class CSVSink:
+    '''
+    Metrics sink that appends records to a CSV file.
+    The columns are the keys of the training records (TRAINING_FIELDS) unless
+    fieldnames is given, missing keys are left empty and unknown keys raise a ValueError.
+    '''
+
+    def __init__(self, filename, fieldnames=None):
+        '''
+        Input:
+            filename: string : path of the CSV file, overwritten if it exists
+            fieldnames: list : optional column names, defaults to TRAINING_FIELDS
+        '''
+        self._file = open(filename, 'w', newline='')
+        self._fieldnames = TRAINING_FIELDS if fieldnames is None else fieldnames
+        self._writer = None
+
+    def write(self, record):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=self._fieldnames)
+            self._writer.writeheader()
+        self._writer.writerow(record)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JSONLinesSink:
+    '''
+    Metrics sink that appends records to a JSON lines file, one record per line
+    '''
+
+    def __init__(self, filename):
+        '''
+        Input:
+            filename: string : path of the JSON lines file, overwritten if it exists
+        '''
+        self._file = open(filename, 'w')
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,178 @@
+import numpy as np
+from agent.state_space import StateSpace
+
+
+class SumTree:
+    '''
+    Binary tree where each parent holds the sum of its children, so that items
+    can be sampled proportionally to their priority with O(log n) sampling and updates
+    '''
+
+    def __init__(self, capacity):
+        '''
+        Input:
+            capacity: Integer : number of items
+        '''
+        self.capacity = capacity
+
+        # Leaves start at index size, the root is at index 1
+        self._size = 1
+        while self._size < capacity:
+            self._size *= 2
+        self._tree = np.zeros(2 * self._size, dtype=np.float64)
+
+    @property
+    def total(self):
+        '''
+        Sum of all priorities
+        '''
+        return self._tree[1]
+
+    def get(self, idx):
+        '''
+        Priority of an item
+        '''
+        return self._tree[self._size + idx]
+
+    def set(self, idx, priority):
+        '''
+        Set the priority of an item and update the sums above it
+        '''
+        pos = self._size + idx
+        change = priority - self._tree[pos]
+        while pos >= 1:
+            self._tree[pos] += change
+            pos //= 2
+
+    def set_all(self, priorities):
+        '''
+        Set the priorities of all items at once
+        '''
+        self._tree[:] = 0
+        self._tree[self._size:self._size + self.capacity] = priorities
+        # Fill the sums level by level, from the leaves up to the root
+        pos = self._size
+        while pos > 1:
+            self._tree[pos // 2:pos] = self._tree[pos:2 * pos:2] + self._tree[pos + 1:2 * pos:2]
+            pos //= 2
+
+    def sample(self, u):
+        '''
+        Find the item at cumulative priority u, u between 0 and total
+        '''
+        pos = 1
+        while pos < self._size:
+            left = 2 * pos
+            if u < self._tree[left]:
+                pos = left
+            else:
+                u -= self._tree[left]
+                pos = left + 1
+        return min(pos - self._size, self.capacity - 1)
+
+
+class PrioritizedStartSampler:
+    '''
+    Start state sampler for Environment.reset that favours the states where
+    the agent's q values are still wrong.
+
+    Every non terminal state of the config (boxes up to MAX_CHOCOLATE) can be
+    drawn, with probability proportional to its priority:
+        'td_error': (|recent td error| + epsilon) ^ alpha
+        'visits': (visits + 1) ^ -alpha, rarely visited states first
+    With probability uniform_mix the usual uniform start state is drawn instead.
+    '''
+
+    def __init__(self, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, priority='td_error', alpha=0.6,
+                 epsilon=0.01, uniform_mix=0.5):
+        '''
+        Input:
+            SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE: Integer : config of the game
+            priority: string : 'td_error' or 'visits'
+            alpha: Float : how strongly the priorities are followed, 0 is uniform
+            epsilon: Float : minimum td error, so that every state can still be drawn
+            uniform_mix: Float : probability of drawing a uniform start state instead
+        '''
+        if priority not in ('td_error', 'visits'):
+            raise ValueError("priority must be 'td_error' or 'visits'")
+
+        self.section = SECTION
+        self.min_chocolate = MIN_CHOCOLATE
+        self.max_chocolate = MAX_CHOCOLATE
+        self.priority = priority
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.uniform_mix = uniform_mix
+
+        # The terminal state has index 0 and is left out
+        self.space = StateSpace(SECTION, MAX_CHOCOLATE)
+        self._tree = SumTree(self.space.n_states - 1)
+        self._visits = np.zeros(self.space.n_states - 1, dtype=np.int64)
+
+        # Unseen states start with the highest priority
+        self._tree.set_all(np.ones(self.space.n_states - 1))
+
+    def _index(self, state):
+        '''
+        Index of a non terminal state in the sum tree, None if it is not part of it
+        '''
+        try:
+            idx = self.space.index_of(state)
+        except ValueError:
+            return None
+        return idx - 1 if idx > 0 else None
+
+    def sample(self):
+        '''
+        Method to draw a start state
+        Output:
+            boxes: array : number of chocolates of each box
+        '''
+        if np.random.uniform() < self.uniform_mix:
+            return np.random.randint(
+                low=self.min_chocolate, high=self.max_chocolate+1, size=self.section
+            )
+
+        idx = self._tree.sample(np.random.uniform() * self._tree.total)
+        return self.space.states[idx + 1].copy()
+
+    def report(self, state, td_error):
+        '''
+        Method to report an update of the agent on a state
+        Input:
+            state: array : state of the update
+            td_error: Float : td error of the update, ignored for 'visits' priority
+        '''
+        idx = self._index(state)
+        if idx is None:
+            return
+
+        if self.priority == 'visits':
+            self._visits[idx] += 1
+            self._tree.set(idx, (self._visits[idx] + 1) ** -self.alpha)
+        elif td_error is not None:
+            self._tree.set(idx, (abs(td_error) + self.epsilon) ** self.alpha)
+
+
+class FixedStartSampler:
+    '''
+    Start state sampler that replays a fixed array of start states in order,
+    so that several training runs see exactly the same games' start states
+    '''
+
+    def __init__(self, starts, offset=0):
+        '''
+        Input:
+            starts: array : start states with shape (n, SECTION)
+            offset: Integer : index of the first start state, wraps around
+        '''
+        self.starts = starts
+        self.position = offset
+
+    def sample(self):
+        boxes = self.starts[self.position % len(self.starts)].copy()
+        self.position += 1
+        return boxes
+
+    def report(self, state, td_error):
+        pass
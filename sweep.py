@@ -0,0 +1,267 @@
+from environment import Environment
+from agent.base_agent import RandomAgent
+from trainer import TwoPlayerGameTrainer, ValueIterationTrainer
+from sampler import FixedStartSampler
+from metrics import CSVSink
+from benchmark import AGENTS
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import itertools
+import json
+import os
+import time
+import numpy as np
+
+
+# Read-only structures built once by SweepRunner and shared with the worker processes
+_SHARED = {}
+
+
+def _init_worker(shared):
+    '''
+    Pool initializer, keeps the shared precomputation of the sweep in the worker
+    '''
+    _SHARED.update(shared)
+
+
+def _trial_key(trial, config, iteration_games):
+    '''
+    Hash of a trial and the sweep settings, used as the name of its cache files
+    '''
+    text = json.dumps(
+        {'trial': trial, 'config': config, 'iteration_games': iteration_games}, sort_keys=True
+    )
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _run_trial(trial, games, cache_dir):
+    '''
+    Train one trial up to a number of games and score its greedy policy.
+    Results are cached on disk, and a trial continues from its cached model
+    of the largest smaller budget instead of starting again.
+
+    Output:
+        result: dictionary : trial, games played, score and seconds
+    '''
+    SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE = _SHARED['config']
+    key = _trial_key(trial, _SHARED['config'], _SHARED['iteration_games'])
+    result_file = os.path.join(cache_dir, f"{key}_{games}.json")
+
+    if os.path.exists(result_file):
+        with open(result_file) as f:
+            return json.load(f)
+
+    # Forked workers start with the same random state, seed every trial and budget on its own
+    np.random.seed(int(hashlib.sha1(f"{key}_{games}".encode()).hexdigest()[:8], 16))
+
+    agent = AGENTS[trial['agent']](
+        alpha=trial['alpha'], epsilon=trial['epsilon'], discount=trial['discount']
+    )
+
+    # Continue from the cached model of the largest smaller budget
+    played, seconds = 0, 0.0
+    for previous in sorted(_SHARED['budgets'], reverse=True):
+        previous_file = os.path.join(cache_dir, f"{key}_{previous}.json")
+        if previous < games and os.path.exists(previous_file):
+            with open(previous_file) as f:
+                seconds = json.load(f)['seconds']
+            agent.load_model(os.path.join(cache_dir, f"{key}_{previous}.npy"))
+            played = previous
+            break
+
+    # Every trial replays the same start states, continuing where the last budget stopped
+    env = Environment(
+        SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, FixedStartSampler(_SHARED['starts'], offset=played)
+    )
+
+    start = time.perf_counter()
+    if trial['mode'] == 'self_play':
+        # Full iterations first, then the remaining games as one shorter iteration
+        iterations, remainder = divmod(games - played, _SHARED['iteration_games'])
+        for n_games, iteration in ((_SHARED['iteration_games'], iterations), (remainder, 1)):
+            if n_games * iteration == 0:
+                continue
+            agent, _ = TwoPlayerGameTrainer.self_play(
+                env, agent, n_games=n_games, iteration=iteration, plot_output=False, verbose=False
+            )
+            played += n_games * iteration
+    else:
+        TwoPlayerGameTrainer.play_and_train(
+            env, agent, RandomAgent(), n_games=games - played, learn=True, verbose=False
+        )
+        played = games
+    seconds += time.perf_counter() - start
+
+    score = ValueIterationTrainer.optimal_action_rate(
+        agent, SECTION, MAX_CHOCOLATE, _SHARED['solution']
+    )
+    result = {'trial': trial, 'key': key, 'games': played, 'score': float(score), 'seconds': seconds}
+
+    agent.save_model(os.path.join(cache_dir, f"{key}_{games}.npy"))
+    with open(result_file, 'w') as f:
+        json.dump(result, f)
+
+    return result
+
+
+class SweepRunner:
+    '''
+    Class for hyperparameter sweeps of QLearningAgent and ExpectedSarsaAgent.
+
+    A trial is a dictionary with agent (name in AGENTS), mode ('random' or
+    'self_play'), alpha, epsilon and discount. Trials run in a process pool and
+    are cut by successive halving: every rung trains the surviving trials with
+    eta times more games and keeps the best 1/eta of them, scored by the fraction
+    of optimal moves of their greedy policy.
+
+    Consists of:
+        grid -> trials of a grid search
+        random -> trials of a random search
+        run -> run the sweep and rank the trials
+    '''
+
+    def __init__(self, SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE, cache_dir="sweep_cache", n_workers=None):
+        '''
+        Input:
+            SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE: Integer : config of the game
+            cache_dir: string : directory of the cached results and models
+            n_workers: Integer : Number of processes, defaults to the number of CPUs
+        '''
+        self.config = (SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE)
+        self.cache_dir = cache_dir
+        self.n_workers = n_workers
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def grid(spec):
+        '''
+        Trials of a grid search
+        Input:
+            spec: dictionary : parameter -> list of values
+        Output:
+            trials: list : one trial per combination of values
+        '''
+        names = sorted(spec)
+        return [dict(zip(names, values)) for values in itertools.product(*(spec[n] for n in names))]
+
+    @staticmethod
+    def random(spec, n_trials, seed=0):
+        '''
+        Trials of a random search
+        Input:
+            spec: dictionary : parameter -> list of values to choose from,
+                or (low, high) tuple to draw uniformly from
+            n_trials: Integer : Number of trials
+            seed: Integer : seed of the random generator
+        Output:
+            trials: list : n_trials trials
+        '''
+        rng = np.random.RandomState(seed)
+        trials = []
+        for _ in range(n_trials):
+            trial = {}
+            for name, values in spec.items():
+                if isinstance(values, tuple):
+                    trial[name] = float(rng.uniform(*values))
+                else:
+                    trial[name] = values[rng.randint(len(values))]
+            trials.append(trial)
+        return trials
+
+    def run(self, trials, min_games=2000, max_games=32000, eta=2, iteration_games=1000,
+            filename=None, verbose=True):
+        '''
+        Run the sweep with successive halving
+
+        Input:
+            trials: list : trials to run, see grid and random
+            min_games: Integer : Number of games of the first rung
+            max_games: Integer : maximum number of games of the last rung
+            eta: Integer : factor of games between rungs, 1/eta of the trials are kept
+            iteration_games: Integer : Number of games of each self play iteration
+            filename: string : optional CSV file to save the ranked results to
+            verbose: Boolean : Indicates whether the ranked results are printed
+        Output:
+            results: list : best result of every trial, ranked by games then score
+        '''
+        SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE = self.config
+
+        budgets = [min_games]
+        while budgets[-1] * eta <= max_games:
+            budgets.append(budgets[-1] * eta)
+
+        # Built once and shared by all trials: the solved game used for scoring,
+        # and the start states of the training games
+        solution = ValueIterationTrainer.solve(SECTION, MAX_CHOCOLATE)
+        starts = np.random.RandomState(0).randint(
+            low=MIN_CHOCOLATE, high=MAX_CHOCOLATE+1, size=(budgets[-1], SECTION)
+        )
+        shared = {
+            'config': self.config,
+            'solution': solution,
+            'starts': starts,
+            'budgets': budgets,
+            'iteration_games': iteration_games,
+        }
+
+        # Fill in the defaults so that equivalent trials share their cache
+        trials = [
+            {'agent': 'QLearningAgent', 'mode': 'random', 'alpha': 0.1, 'epsilon': 0.3, 'discount': 1,
+             **trial}
+            for trial in trials
+        ]
+
+        best = {}
+        survivors = trials
+        with ProcessPoolExecutor(self.n_workers, initializer=_init_worker, initargs=(shared,)) as pool:
+            for rung, games in enumerate(budgets):
+                results = list(pool.map(
+                    _run_trial, survivors, [games] * len(survivors), [self.cache_dir] * len(survivors)
+                ))
+                for result in results:
+                    best[result['key']] = result
+
+                if verbose:
+                    print(f"Rung {rung+1}: {len(survivors)} trials with {games} games")
+
+                # Keep the best 1/eta trials for the next rung
+                results.sort(key=lambda result: result['score'], reverse=True)
+                survivors = [result['trial'] for result in results[:max(len(results) // eta, 1)]]
+
+        ranked = sorted(best.values(), key=lambda result: (result['games'], result['score']), reverse=True)
+
+        if filename is not None:
+            rows = [{**result['trial'], **{k: v for k, v in result.items() if k != 'trial'}} for result in ranked]
+            fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+            with CSVSink(filename, fieldnames) as sink:
+                for row in rows:
+                    sink.write(row)
+
+        if verbose:
+            print(f"\n{'rank':>4} {'agent':>18} {'mode':>9} {'alpha':>7} {'epsilon':>7} "
+                  f"{'discount':>8} {'games':>7} {'score':>6}")
+            for rank, result in enumerate(ranked, 1):
+                trial = result['trial']
+                print(f"{rank:>4} {trial['agent']:>18} {trial['mode']:>9} {trial['alpha']:>7.3f} "
+                      f"{trial['epsilon']:>7.3f} {trial['discount']:>8.3f} {result['games']:>7} "
+                      f"{result['score']:>6.3f}")
+
+        return ranked
+
+
+if __name__ == "__main__":
+
+    SECTION = 3
+    MAX_CHOCOLATE = 10
+    MIN_CHOCOLATE = 3
+
+    runner = SweepRunner(SECTION, MIN_CHOCOLATE, MAX_CHOCOLATE)
+    trials = SweepRunner.grid({
+        'agent': ['QLearningAgent', 'ExpectedSarsaAgent'],
+        'alpha': [0.1, 0.3, 0.5],
+        'epsilon': [0.1, 0.3],
+        'discount': [1],
+    })
+    runner.run(trials, min_games=2000, max_games=16000, filename="sweep_results.csv")
@@ -3,10 +3,19 @@ from environment import MAX_CHOCOLATE, MIN_CHOCOLATE, Environment
 from agent.td_agent import QLearningAgent
 from agent.td_agent import ExpectedSarsaAgent
 from agent.base_agent import RandomAgent
+from agent.state_space import StateSpace
 
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
-from IPython import display
+from collections import defaultdict
+import io
+import time
+
+try:
+    from IPython import display
+except ImportError:
+    # Plots can still be saved to a file without IPython
+    display = None
 
 class TwoPlayerGameTrainer:
     '''
@@ -71,7 +80,8 @@ class TwoPlayerGameTrainer:
             s = next_s
 
     @staticmethod
-    def play_and_train(env, agent1, agent2, n_games=10000, learn=True, verbose=True):
+    def play_and_train(env, agent1, agent2, n_games=10000, learn=True, verbose=True, recorder=None,
+                       metrics=None):
         '''
         Run a full game using two agents. Agent 1 can be set to learn, while agent 2
         can only play. This is necessary to make the environment fixed.
@@ -85,6 +95,10 @@ class TwoPlayerGameTrainer:
             agent2: RL Agent : Instantiation of RL agent
             n_games: Integer : Number of games to play
             learn: Boolean : Indicates whether agent1 is learning
+            recorder: TrajectoryRecorder : optional recorder that stores every move
+            metrics: metrics sink : optional sink that receives one record per game,
+                {'event': 'game', 'game', 'result', 'moves'} where moves is the number
+                of moves of agent 1
         Output:
             game_history: Array : Array with size n_games that is +1 if agent 1 wins,
                                 and -1 if agent 1 loses
@@ -111,14 +125,19 @@ class TwoPlayerGameTrainer:
         # Agent 2 will not learn
         agent2.learning_mode_off()
 
+        # Start states are drawn from the environment's sampler only while learning,
+        # and the sampler is fed with the td errors of agent 1
+        sampler = env.start_sampler if learn else None
+
         # Loop until termination
         for t in range(n_games):
             if verbose:
                 print(f"Running game: {t+1}", end='\r')
             
             # Get the initial state
-            s = env.reset()
+            s = env.reset(from_sampler=learn)
             done = False
+            n_moves = 0
 
             # Loop until game over
             while True:
@@ -129,16 +148,21 @@ class TwoPlayerGameTrainer:
                 
                 # Get action from agent 1
                 a = agent1.get_action(s)
+                n_moves += 1
                 
                 # Make a step
                 next_s, r, done = env.step(a)
-                
+
+                if recorder is not None:
+                    recorder.record(s, a, 1, r, next_s, done)
 
                 if done:
                     game_history[t] = -1
                     if learn:
                         # Update q table with losing reward
-                        agent1.update(s, a, REWARD_DICT['LOSE'], next_s)
+                        td_error = agent1.update(s, a, REWARD_DICT['LOSE'], next_s)
+                        if sampler is not None:
+                            sampler.report(s, td_error)
                     break
                 
                 ##################
@@ -149,28 +173,43 @@ class TwoPlayerGameTrainer:
                 a2 = agent2.get_action(next_s)
                 
                 # Make a step
+                s2 = next_s
                 next_s, r, done = env.step(a2)
-                
+
+                if recorder is not None:
+                    recorder.record(s2, a2, 2, r, next_s, done)
+
                 if done:
                     if learn:
                         # Update q table using winning reward and the next state of agent 2
-                        agent1.update(s, a, REWARD_DICT['WIN'], next_s)
+                        td_error = agent1.update(s, a, REWARD_DICT['WIN'], next_s)
+                        if sampler is not None:
+                            sampler.report(s, td_error)
                     game_history[t] = 1
                     n_wins += 1
                     break
                 else:
                     if learn:
                         # Otherwise update q table using next state of agent 2
-                        agent1.update(s, a, REWARD_DICT['EXPLORE'], next_s)
+                        td_error = agent1.update(s, a, REWARD_DICT['EXPLORE'], next_s)
+                        if sampler is not None:
+                            sampler.report(s, td_error)
                     
                 # next state
                 s = next_s
-                    
-        print("\nDone!")
+
+            if metrics is not None:
+                metrics.write(
+                    {'event': 'game', 'game': t+1, 'result': int(game_history[t]), 'moves': n_moves}
+                )
+
+        if verbose:
+            print("\nDone!")
         return game_history, (n_wins/n_games)
 
     @staticmethod
-    def self_play(env, agent, n_games=10000, iteration=20, plot_output=True):
+    def self_play(env, agent, n_games=10000, iteration=20, plot_output=True, recorder=None,
+                  metrics=None, visualizer=None, verbose=True):
         '''
         Method to train agent by self play
         Input:
@@ -178,13 +217,19 @@ class TwoPlayerGameTrainer:
             agent: RL Agent : Instantiation of RL Agent
             n_games: Integer : Number of games each iteration
             iteration: Integer : Number of iteration
+            recorder: TrajectoryRecorder : optional recorder that stores every move
+            metrics: metrics sink : optional sink that receives the game records of
+                play_and_train and one {'event': 'iteration', 'iteration', 'win_rate'}
+                record per iteration
+            visualizer: Visualizer : plotter used if plot_output, defaults to Visualizer()
+            verbose: Boolean : Indicates whether the winning rates are printed when not plotted
         Output:
             agent_new: RL Agent : New agent after self play training
         '''
     
         env.game.verbose = False  # Omit game output
 
-        if plot_output:
+        if plot_output and visualizer is None:
             visualizer = Visualizer()
         
         import copy
@@ -199,45 +244,225 @@ class TwoPlayerGameTrainer:
         win_rates = []
 
         for i in range(iteration):
-            if not plot_output:
+            if not plot_output and verbose:
                 print(f"\nIteration {i+1}")
             history, n_win = TwoPlayerGameTrainer.play_and_train(
-                env=env, agent1=agent_new, agent2=agent_old, n_games = n_games, learn=True, verbose=False
+                env=env, agent1=agent_new, agent2=agent_old, n_games = n_games, learn=True, verbose=False,
+                recorder=recorder, metrics=metrics
             )
 
             # Record win rates
             win_rates.append(n_win)
+            if metrics is not None:
+                metrics.write({'event': 'iteration', 'iteration': i+1, 'win_rate': n_win})
 
             # Copy new agent attributes into to agent_old
             agent_old = copy.deepcopy(agent_new)
 
-            # Notify winning rate
+            # Notify winning rate, the last iteration is always drawn
             if plot_output:
-                visualizer.plot_win_rates(win_rates)
-            else:
+                visualizer.plot_win_rates(win_rates, force=(i == iteration-1))
+            elif verbose:
                 print(f"Winning rate: {n_win}")
 
         return agent_new, win_rates
 
 
-class Visualizer:
-    
+class ValueIterationTrainer:
+    '''
+    Class for planning with the full model of the game.
+
+    For bounded configs the whole state x action space fits in memory, so instead
+    of sampling games the q table is computed by synchronous Bellman sweeps over
+    all states and actions at once.
+
+    Consists of:
+        solve -> compute the q table of all states and actions as an array
+        train -> compute the q table and write it into a QLearningAgent
+    '''
+
     @staticmethod
-    def plot_win_rates(win_rates):
-        _ = display.clear_output(wait=True)
-        _ = display.display(plt.gcf())
-        _ = plt.figure(figsize=(6, 4), dpi=80)
-        _ = plt.clf()
-        _ = plt.title('Self Play...')
-        _ = plt.xlabel('Number of Games')
-        _ = plt.ylabel('Score')
-        _ = plt.plot(np.arange(1, len(win_rates)+1), win_rates)
-        _ = plt.xlim(xmin=1, xmax=len(win_rates)+1)
-        _ = plt.ylim(ymin=0)
-        _ = plt.text(len(win_rates), win_rates[-1], str(win_rates[-1]))
-        _ = plt.legend(["Winning rate"])
-        _ = plt.grid()
-        _ = plt.show()
+    def solve(SECTION, MAX_CHOCOLATE, discount=1, tol=1e-9, max_sweeps=1000):
+        '''
+        Run synchronous Bellman sweeps until convergence.
+
+        The q value follows the agent's point of view used in play_and_train,
+        the opponent moves between the action and the next state of the agent:
+            Q(s, a) = -1 if s' is empty
+            Q(s, a) = min_b (1 if s'' is empty else discount * V(s''))
+        where s' is the state after the action, s'' is the state after the opponent
+        plays b from s', and V(s) = max_a Q(s, a).
+
+        Input:
+            SECTION: Integer : number of boxes
+            MAX_CHOCOLATE: Integer : maximum number of chocolates in a box
+            discount: Float : discount rate of future reward
+            tol: Float : stop when the largest change of q value is below tol
+            max_sweeps: Integer : maximum number of sweeps
+        Output:
+            qvalues: array (n_states, n_actions) : q values, 0 for illegal actions
+            space: StateSpace : indexing of the states and actions
+            n_sweeps: Integer : number of sweeps until convergence
+        '''
+        space = StateSpace(SECTION, MAX_CHOCOLATE)
+        next_idx, legal = space.transitions()
+        terminal = legal & (next_idx == 0)
+
+        qvalues = np.zeros(next_idx.shape, dtype=np.float64)
+
+        n_sweeps = 0
+        for n_sweeps in range(1, max_sweeps + 1):
+            # Value of every state for the player to move
+            values = np.where(legal, qvalues, -np.inf).max(axis=1)
+            values[0] = 0
+
+            # Value of every opponent move from the opponent's state, seen by the agent
+            opponent = np.where(terminal, 1, discount * values[next_idx])
+            opponent = np.where(legal, opponent, np.inf).min(axis=1)
+
+            new_qvalues = np.where(terminal, -1, opponent[next_idx])
+            new_qvalues = np.where(legal, new_qvalues, 0)
+
+            delta = np.max(np.abs(new_qvalues - qvalues))
+            qvalues = new_qvalues
+            if delta < tol:
+                break
+
+        return qvalues, space, n_sweeps
+
+    @staticmethod
+    def train(agent, SECTION, MAX_CHOCOLATE, tol=1e-9, max_sweeps=1000, verbose=True):
+        '''
+        Compute the q table by value iteration and write it into the agent.
+        The discount rate of the agent is used.
+
+        Input:
+            agent: QLearningAgent : agent to write the q table into
+            SECTION: Integer : number of boxes
+            MAX_CHOCOLATE: Integer : maximum number of chocolates in a box
+            tol: Float : stop when the largest change of q value is below tol
+            max_sweeps: Integer : maximum number of sweeps
+            verbose: Boolean : Indicates whether the number of sweeps is printed
+        Output:
+            agent: QLearningAgent : the same agent with the computed q table
+        '''
+        qvalues, space, n_sweeps = ValueIterationTrainer.solve(
+            SECTION, MAX_CHOCOLATE, agent.discount, tol, max_sweeps
+        )
+
+        if verbose:
+            print(f"Value iteration converged after {n_sweeps} sweeps")
+
+        # Dense q tables use the same indexing, set the whole array at once
+        if agent._qtable is not None:
+            agent._qtable.set_all(qvalues)
+            return agent
+
+        actions = [tuple(action) for action in space.actions.tolist()]
+        states = space.states.tolist()
+        legal = space.states[:, space.actions[:, 0] - 1] >= space.actions[None, :, 1]
+
+        # Write the legal q values of every non terminal state into the q table
+        agent._qvalues = defaultdict(lambda: defaultdict(lambda: 0))
+        for idx in range(1, space.n_states):
+            action_idx = np.flatnonzero(legal[idx])
+            agent._qvalues[tuple(states[idx])] = agent._dict_to_defaultdict(
+                zip([actions[i] for i in action_idx], qvalues[idx, action_idx].tolist())
+            )
+
+        return agent
+
+    @staticmethod
+    def optimal_action_rate(agent, SECTION, MAX_CHOCOLATE, solution=None):
+        '''
+        Score the greedy policy of an agent against the solved game.
+        Only winning states are scored, since every action of a losing state is as bad.
+
+        Input:
+            agent: RL Agent : agent with get_best_actions
+            SECTION: Integer : number of boxes
+            MAX_CHOCOLATE: Integer : maximum number of chocolates in a box
+            solution: tuple : optional output of solve, to avoid solving again
+        Output:
+            rate: Float : fraction of winning states where the greedy action wins
+        '''
+        if solution is None:
+            solution = ValueIterationTrainer.solve(SECTION, MAX_CHOCOLATE)
+        qvalues, space, _ = solution
+
+        # A state is winning if one of its actions has a positive q value
+        winning = np.flatnonzero(qvalues.max(axis=1) > 0)
+
+        actions = agent.get_best_actions(space.states[winning])
+        optimal = qvalues[winning, space.action_index(actions)] > 0
+
+        return np.mean(optimal)
+
+
+class Visualizer:
+    '''
+    Class for plotting the winning rate during training.
+
+    One figure is reused for the whole run and redrawn at most every min_interval
+    seconds. The plot is saved to filename if given (works without a display),
+    otherwise it is shown in the Jupyter notebook.
+    '''
+
+    def __init__(self, min_interval=5.0, filename=None):
+        '''
+        Input:
+            min_interval: Float : minimum number of seconds between two redraws
+            filename: string : optional PNG file to save the plot to
+        '''
+        self.min_interval = min_interval
+        self.filename = filename
+        self._figure = None
+        self._last_draw = -np.inf
+
+    def _init_figure(self):
+        '''
+        Create the figure once, later redraws only update its data
+        '''
+        self._figure = Figure(figsize=(6, 4), dpi=80)
+        self._ax = self._figure.add_subplot()
+        self._ax.set_title('Self Play...')
+        self._ax.set_xlabel('Number of Games')
+        self._ax.set_ylabel('Score')
+        self._line, = self._ax.plot([], [])
+        self._text = self._ax.text(0, 0, '')
+        self._ax.legend(["Winning rate"])
+        self._ax.grid()
+
+    def plot_win_rates(self, win_rates, force=False):
+        '''
+        Method to plot the winning rates, skipped if the last redraw is too recent
+        Input:
+            win_rates: list : winning rate of each iteration
+            force: Boolean : redraw even if the last redraw is too recent
+        '''
+        now = time.monotonic()
+        if not force and now - self._last_draw < self.min_interval:
+            return
+        self._last_draw = now
+
+        if self._figure is None:
+            self._init_figure()
+
+        self._line.set_data(np.arange(1, len(win_rates)+1), win_rates)
+        self._text.set_position((len(win_rates), win_rates[-1]))
+        self._text.set_text(str(win_rates[-1]))
+        self._ax.set_xlim(xmin=1, xmax=len(win_rates)+1)
+        self._ax.relim()
+        self._ax.autoscale_view(scalex=False)
+        self._ax.set_ylim(ymin=0)
+
+        if self.filename is not None:
+            self._figure.savefig(self.filename)
+        elif display is not None:
+            buffer = io.BytesIO()
+            self._figure.savefig(buffer, format='png')
+            display.clear_output(wait=True)
+            display.display(display.Image(data=buffer.getvalue()))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+import glob
+import os
+import numpy as np
+
+
+# Columns of a trajectory segment, with their data type and number of values per move
+COLUMNS = {
+    'state': np.int16,
+    'action': np.int16,
+    'mover': np.int8,
+    'reward': np.int8,
+    'next_state': np.int16,
+    'done': np.bool_,
+}
+
+
+class TrajectoryRecorder:
+    '''
+    Recorder that streams every move of the played games to disk.
+
+    Moves are buffered in fixed-width integer arrays and written in chunks, each
+    chunk is a segment made of one .npy file per column:
+        {segment}_state.npy, {segment}_action.npy, {segment}_mover.npy,
+        {segment}_reward.npy, {segment}_next_state.npy, {segment}_done.npy
+
+    Pass the recorder to TwoPlayerGameTrainer.play_and_train or self_play, and
+    read the files back with OfflineTrainer.
+    '''
+
+    def __init__(self, directory, SECTION, chunk_size=65536):
+        '''
+        Input:
+            directory: string : directory of the segments, created if needed
+            SECTION: Integer : number of boxes
+            chunk_size: Integer : number of moves per segment
+        '''
+        self.directory = directory
+        self.section = SECTION
+        self.chunk_size = chunk_size
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Continue after the segments already in the directory
+        self._n_segments = len(_segment_names(directory))
+        self._n_moves = 0
+        self._buffer = {
+            'state': np.zeros((chunk_size, SECTION), dtype=COLUMNS['state']),
+            'action': np.zeros((chunk_size, 2), dtype=COLUMNS['action']),
+            'mover': np.zeros(chunk_size, dtype=COLUMNS['mover']),
+            'reward': np.zeros(chunk_size, dtype=COLUMNS['reward']),
+            'next_state': np.zeros((chunk_size, SECTION), dtype=COLUMNS['next_state']),
+            'done': np.zeros(chunk_size, dtype=COLUMNS['done']),
+        }
+
+    def record(self, state, action, mover, reward, next_state, done):
+        '''
+        Method to record one move
+        Input:
+            state: array : state before the move
+            action: array : action taken, [box, n] with 1-based box
+            mover: Integer : 1 if agent 1 moved, 2 if agent 2 moved
+            reward: Integer : reward returned by the environment
+            next_state: array : state after the move
+            done: Boolean : True if the move ended the game
+        '''
+        i = self._n_moves
+        self._buffer['state'][i] = state
+        self._buffer['action'][i] = action
+        self._buffer['mover'][i] = mover
+        self._buffer['reward'][i] = reward
+        self._buffer['next_state'][i] = next_state
+        self._buffer['done'][i] = done
+
+        self._n_moves += 1
+        if self._n_moves == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Method to write the buffered moves as a new segment
+        '''
+        if self._n_moves == 0:
+            return
+
+        prefix = os.path.join(self.directory, f"{self._n_segments:06d}")
+        for column, values in self._buffer.items():
+            np.save(f"{prefix}_{column}.npy", values[:self._n_moves])
+
+        self._n_segments += 1
+        self._n_moves = 0
+
+    def close(self):
+        '''
+        Method to write the remaining moves, must be called after recording
+        '''
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _segment_names(directory):
+    '''
+    Helper function to list the segments of a directory in recording order
+    '''
+    files = glob.glob(os.path.join(directory, "*_done.npy"))
+    return sorted(os.path.basename(f)[:-len("_done.npy")] for f in files)
+
+
+class OfflineTrainer:
+    '''
+    Class for training agents from recorded trajectories.
+
+    Consists of:
+        read -> iterate over the recorded moves in bounded memory chunks
+        train -> replay the recorded moves through agent.update
+    '''
+
+    @staticmethod
+    def read(directory, chunk_size=65536):
+        '''
+        Iterate over the recorded moves. Segments are opened with np.memmap,
+        so only one chunk of each column is in memory at a time
+
+        Input:
+            directory: string : directory of the segments
+            chunk_size: Integer : number of moves per chunk
+        Output:
+            generator of dictionaries column -> list of values of the chunk
+        '''
+        for name in _segment_names(directory):
+            prefix = os.path.join(directory, name)
+            columns = {
+                column: np.load(f"{prefix}_{column}.npy", mmap_mode='r') for column in COLUMNS
+            }
+
+            n_moves = len(columns['done'])
+            for start in range(0, n_moves, chunk_size):
+                yield {
+                    column: values[start:start + chunk_size].tolist()
+                    for column, values in columns.items()
+                }
+
+    @staticmethod
+    def train(agent, directory, movers=(1,), chunk_size=65536, verbose=True):
+        '''
+        Replay recorded moves through the update path of a TD agent.
+
+        Updates are made the same way as play_and_train, from the mover's point
+        of view: the next state of an update is the state after the opponent's reply.
+
+        Input:
+            agent: RL Agent : agent to train, must have agent.update
+            directory: string : directory of the segments
+            movers: tuple : which players' moves are learned, 1 for agent 1, 2 for agent 2
+            chunk_size: Integer : number of moves read into memory at a time
+            verbose: Boolean : Indicates whether the progress is printed
+        Output:
+            n_updates: Integer : number of updates made
+        '''
+
+        # Define the common reward dictionary for two player game
+        REWARD_DICT = {'WIN': 1, 'LOSE': -1, 'EXPLORE': 0}
+
+        agent.learning_mode_on()
+
+        n_updates = 0
+        pending = None  # move waiting for the opponent's reply, kept across chunks
+
+        for chunk in OfflineTrainer.read(directory, chunk_size):
+            for state, action, mover, next_state, done in zip(
+                chunk['state'], chunk['action'], chunk['mover'], chunk['next_state'], chunk['done']
+            ):
+                # This move is the opponent's reply to the pending move
+                if pending is not None:
+                    pending_state, pending_action, pending_mover = pending
+                    if pending_mover in movers:
+                        reward = REWARD_DICT['WIN'] if done else REWARD_DICT['EXPLORE']
+                        agent.update(pending_state, pending_action, reward, next_state)
+                        n_updates += 1
+                    pending = None
+
+                if done:
+                    # Taking the last chocolate loses the game
+                    if mover in movers:
+                        agent.update(state, action, REWARD_DICT['LOSE'], next_state)
+                        n_updates += 1
+                else:
+                    pending = (state, action, mover)
+
+            if verbose:
+                print(f"Updates: {n_updates}", end='\r')
+
+        if verbose:
+            print("\nDone!")
+
+        return n_updates